@@ -0,0 +1,205 @@
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+from evaluate.lots import COST_BASIS_METHODS
+
+EXCLUDE_COLUMNS = ["cryptocurrency", "date_acquired", "date_sold"]
+
+
+def load_manifest(manifest_path: Union[str, Path]) -> List[dict]:
+
+    # a JSON list of portfolios, e.g. {"name": "client-1", "source": "csv", "path": "client-1.csv",
+    # "tax_year": 2021, "fiat_currency": "usd", "cost_basis": "fifo"}, sheets portfolios set "sheet_id" and
+    # optionally "ranges", a string or list of ranges, instead of "path"
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    portfolios = []
+    names = set()
+    for i, portfolio in enumerate(manifest, start=1):
+        if not isinstance(portfolio, dict):
+            portfolios.append({
+                "name": f"portfolio-{i}", "error": f"Portfolio {i} of {manifest_path} is not an object, check manifest!"
+            })
+            continue
+        portfolio = dict(portfolio)
+        portfolio["name"] = str(portfolio.get("name", f"portfolio-{i}"))
+        try:
+            portfolio["source"] = str(portfolio.get("source", "csv")).lower()
+            portfolio["fiat_currency"] = str(portfolio.get("fiat_currency", "usd")).lower()
+            portfolio["cost_basis"] = str(portfolio.get("cost_basis", "fifo")).lower()
+            portfolio["offline"] = bool(portfolio.get("offline", False))
+            # ranges are semicolon separated like SHEET_RANGES, a list of ranges is joined the same way
+            if isinstance(portfolio.get("ranges"), list) and all(isinstance(r, str) for r in portfolio["ranges"]):
+                portfolio["ranges"] = ";".join(portfolio["ranges"])
+            for key in ["path", "sheet_id", "ranges"]:
+                if portfolio.get(key) is not None and not isinstance(portfolio[key], str):
+                    raise ValueError(f"The {key} of {portfolio['name']} must be a string, check manifest!")
+            # file paths are relative to the manifest
+            if portfolio.get("path"):
+                portfolio["path"] = str(manifest_path.parent / portfolio["path"])
+
+            if portfolio["name"] in names:
+                raise ValueError(f"Duplicate portfolio name {portfolio['name']} in {manifest_path}, check manifest!")
+            if portfolio["cost_basis"] not in COST_BASIS_METHODS:
+                raise ValueError(f"Unknown cost basis method {portfolio['cost_basis']} of {portfolio['name']}!")
+            if portfolio["source"] != "sheets" and not portfolio.get("path"):
+                raise ValueError(f"File source of {portfolio['name']} requires a path, check manifest!")
+        except ValueError as err:
+            # a broken entry only fails its own portfolio, it is reported with the results of the others
+            portfolio["error"] = str(err)
+        names.add(portfolio["name"])
+        portfolios.append(portfolio)
+    return portfolios
+
+
+def get_source_key(portfolio: dict) -> Tuple:
+    return (
+        portfolio["source"], portfolio.get("path"), portfolio.get("sheet_id"), portfolio.get("ranges"),
+        portfolio["offline"]
+    )
+
+
+def run_portfolio_group(portfolios: List[dict], output_dir: str, workers: int = 1,
+                        price_db_path: str = None) -> List[dict]:
+
+    # portfolios of one source share its ledger per fiat currency, it is loaded and normalized only once
+    ledgers = {}  # type: Dict[str, Union[TxData, Exception]]
+    # SQLite connections cannot be shared across processes, so every group opens the price store itself
+    price_store = None
+    if price_db_path:
+        try:
+            from data.prices import PriceStore
+            price_store = PriceStore(price_db_path)
+        except Exception as err:
+            price_store = err
+    results = []
+    for portfolio in portfolios:
+        start = time.perf_counter()
+        result = OrderedDict([("name", portfolio["name"]), ("status", "ok")])
+        try:
+            if isinstance(price_store, Exception):
+                raise price_store
+            fiat_currency = portfolio["fiat_currency"]
+            if fiat_currency not in ledgers:
+                try:
+                    ledgers[fiat_currency] = TxData(
+                        fiat_currency,
+                        offline=portfolio["offline"],
+                        data_source=portfolio["source"],
+                        file_path=portfolio.get("path"),
+                        sheet_id=portfolio.get("sheet_id"),
+                        sheet_ranges=portfolio.get("ranges"),
+                        price_store=price_store
+                    )
+                except Exception as err:
+                    ledgers[fiat_currency] = err
+            if isinstance(ledgers[fiat_currency], Exception):
+                raise ledgers[fiat_currency]
+
+            tax_year = portfolio.get("tax_year")
+            taxable_crypto = TaxableCrypto(
+                tax_year=tax_year,
+                fiat_currency=fiat_currency,
+                expenditure_types=portfolio.get("expenditure_types"),
+                workers=workers,
+                cost_basis_method=portfolio["cost_basis"],
+                tx_data=ledgers[fiat_currency]
+            )
+            capital_gains_and_losses_df = taxable_crypto.get_capital_gains_and_losses_df(
+                exclude_columns=list(EXCLUDE_COLUMNS)
+            )
+
+            portfolio_dir = Path(output_dir) / portfolio["name"]
+            if not portfolio_dir.exists():
+                os.makedirs(portfolio_dir)
+            file_prefix = f"{f'{tax_year}-' if tax_year else ''}cryptocurrency_to_{fiat_currency}"
+            capital_gains_and_losses_df.to_csv(portfolio_dir / f"{file_prefix}-capital_gains_and_losses.csv")
+            result["capital_gains_and_losses"] = len(capital_gains_and_losses_df)
+
+            # taxable income is reported per tax year only
+            if tax_year:
+                taxable_income_df = taxable_crypto.get_taxable_income_df(exclude_columns=list(EXCLUDE_COLUMNS))
+                taxable_income_df.to_csv(portfolio_dir / f"{file_prefix}-taxable_income.csv")
+                result["taxable_income"] = len(taxable_income_df)
+
+        except Exception as err:
+            # one broken portfolio must not stop the batch
+            result["status"] = "failed"
+            result["error"] = f"{type(err).__name__}: {err}"
+            result["traceback"] = traceback.format_exc()
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        results.append(result)
+
+    if price_store is not None and not isinstance(price_store, Exception):
+        price_store.close()
+    return results
+
+
+def run_batch(portfolios: List[dict], output_dir: Union[str, Path], jobs: int = 1, workers: int = 1,
+              price_db_path: str = None) -> dict:
+
+    start = time.perf_counter()
+    results = [None] * len(portfolios)  # type: List[Union[dict, None]]
+    groups = OrderedDict()  # type: Dict[Tuple, List[dict]]
+    group_indexes = OrderedDict()  # type: Dict[Tuple, List[int]]
+    for i, portfolio in enumerate(portfolios):
+        # portfolios with a broken manifest entry fail without being run
+        if portfolio.get("error"):
+            results[i] = OrderedDict([
+                ("name", portfolio["name"]), ("status", "failed"), ("error", f"ValueError: {portfolio['error']}"),
+                ("seconds", 0)
+            ])
+            continue
+        groups.setdefault(get_source_key(portfolio), []).append(portfolio)
+        group_indexes.setdefault(get_source_key(portfolio), []).append(i)
+
+    jobs = jobs if jobs > 0 else os.cpu_count()
+    if jobs == 1 or len(groups) < 2:
+        group_results = [
+            run_portfolio_group(group, str(output_dir), workers, price_db_path) for group in groups.values()
+        ]
+    else:
+        # matching is CPU bound, so sources are spread over processes and each process keeps its own caches
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(groups))) as executor:
+            futures = [
+                executor.submit(run_portfolio_group, group, str(output_dir), workers, price_db_path)
+                for group in groups.values()
+            ]
+            group_results = [future.result() for future in futures]
+
+    # results are matched by position, a duplicate name of a failed entry cannot replace another portfolio's result
+    for indexes, group_result in zip(group_indexes.values(), group_results):
+        for i, result in zip(indexes, group_result):
+            results[i] = result
+    seconds = time.perf_counter() - start
+    row_count = sum(result.get("capital_gains_and_losses", 0) + result.get("taxable_income", 0) for result in results)
+    failed = [result["name"] for result in results if result["status"] == "failed"]
+
+    summary = OrderedDict([
+        ("portfolios", len(results)),
+        ("succeeded", len(results) - len(failed)),
+        ("failed", failed),
+        ("sources", len(groups)),
+        ("jobs", min(jobs, len(groups))),
+        ("seconds", round(seconds, 4)),
+        ("portfolios_per_second", round(len(results) / seconds, 2) if seconds else None),
+        ("rows_per_second", round(row_count / seconds, 2) if seconds else None),
+        ("results", results)
+    ])
+
+    if not Path(output_dir).exists():
+        os.makedirs(output_dir)
+    with open(Path(output_dir) / "summary.json", "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    return summary
@@ -0,0 +1,171 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Callable, Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+from evaluate.lots import COST_BASIS_METHODS
+
+EXCLUDE_COLUMNS = ["cryptocurrency", "date_acquired", "date_sold"]
+
+
+class LedgerService(object):
+
+    def __init__(self, offline: bool = False, workers: int = 1, expenditure_types: List[str] = None,
+                 reload_interval: float = 30.0, tx_data_factory: Callable[[str], TxData] = None, price_store=None):
+        self.offline = offline
+        self.workers = workers
+        self.expenditure_types = expenditure_types
+        self.reload_interval = reload_interval
+        self.price_store = price_store
+        self._tx_data_factory = tx_data_factory if tx_data_factory else self._create_tx_data
+        # normalized ledgers with warm transaction partitions per fiat currency, and the results computed from them
+        self._ledgers = {}  # type: Dict[str, TxData]
+        self._results = {}  # type: Dict[Tuple[str, str, Union[int, None], str], bytes]
+        self._source_version = None  # type: Union[str, None]
+        self._checked_at = 0.0
+        self._lock = Lock()
+
+    def _create_tx_data(self, fiat_currency: str) -> TxData:
+        return TxData(fiat_currency, offline=self.offline, price_store=self.price_store)
+
+    def _check_source(self):
+        # the source is checked at most once per reload interval, e.g. one Drive metadata request per interval
+        if not self._ledgers or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+
+        source_version = next(iter(self._ledgers.values())).get_source_version()
+        if source_version is not None and source_version != self._source_version:
+            self._ledgers = {}
+            self._results = {}
+
+    def get_ledger(self, fiat_currency: str) -> TxData:
+
+        with self._lock:
+            self._check_source()
+            if fiat_currency not in self._ledgers:
+                tx_data = self._tx_data_factory(fiat_currency)
+                # the transaction objects are created once here and shared by every request
+                list(tx_data.iter_partitions())
+                if not self._ledgers:
+                    self._source_version = tx_data.get_source_version()
+                    self._checked_at = time.monotonic()
+                self._ledgers[fiat_currency] = tx_data
+            return self._ledgers[fiat_currency]
+
+    def reload(self):
+        with self._lock:
+            self._ledgers = {}
+            self._results = {}
+
+    def get_status(self) -> dict:
+        return {
+            "status": "ok",
+            "source_version": self._source_version,
+            "fiat_currencies": sorted(self._ledgers.keys()),
+            "cached_results": len(self._results)
+        }
+
+    def get_result(self, endpoint: str, fiat_currency: str, tax_year: Union[int, None],
+                   cost_basis_method: str) -> bytes:
+
+        tx_data = self.get_ledger(fiat_currency)
+        key = (endpoint, fiat_currency, tax_year, cost_basis_method)
+        result = self._results.get(key)
+        if result is not None:
+            return result
+
+        taxable_crypto = TaxableCrypto(
+            tax_year=tax_year,
+            fiat_currency=fiat_currency,
+            expenditure_types=self.expenditure_types,
+            workers=self.workers,
+            cost_basis_method=cost_basis_method,
+            tx_data=tx_data
+        )
+        if endpoint == "capital_gains":
+            result_df = taxable_crypto.get_capital_gains_and_losses_df(exclude_columns=list(EXCLUDE_COLUMNS))
+        else:
+            # taxable income is collected while capital gains are matched
+            taxable_crypto.get_capital_gains_and_losses()
+            result_df = taxable_crypto.get_taxable_income_df(exclude_columns=list(EXCLUDE_COLUMNS))
+        result = result_df.to_json(orient="records", date_format="iso").encode("utf-8")
+
+        with self._lock:
+            # results computed from a ledger that was reloaded in the meantime are not cached
+            if self._ledgers.get(fiat_currency) is tx_data:
+                self._results[key] = result
+        return result
+
+
+class LedgerRequestHandler(BaseHTTPRequestHandler):
+    ledger_service = None  # type: LedgerService
+
+    def _send_json(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, json.dumps({"error": message}).encode("utf-8"))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        endpoint = url.path.strip("/")
+
+        if endpoint == "health":
+            self._send_json(200, json.dumps(self.ledger_service.get_status()).encode("utf-8"))
+            return
+        if endpoint not in ["capital_gains", "taxable_income"]:
+            self._send_error(404, f"Unknown endpoint /{endpoint}, use /capital_gains, /taxable_income or /health.")
+            return
+
+        try:
+            tax_year = int(params["year"]) if params.get("year") else None
+        except ValueError:
+            self._send_error(400, f"Invalid year {params['year']}.")
+            return
+        fiat_currency = params.get("currency", "usd").lower()
+        cost_basis_method = params.get("strategy", "fifo").lower()
+        if cost_basis_method not in COST_BASIS_METHODS:
+            self._send_error(
+                400, f"Unknown strategy {cost_basis_method}, use one of {', '.join(COST_BASIS_METHODS.keys())}."
+            )
+            return
+        if endpoint == "taxable_income" and tax_year is None:
+            self._send_error(400, "Taxable income requires a year.")
+            return
+
+        try:
+            self._send_json(
+                200, self.ledger_service.get_result(endpoint, fiat_currency, tax_year, cost_basis_method)
+            )
+        except (IndexError, ValueError, FileNotFoundError) as err:
+            self._send_error(422, str(err))
+
+    def do_POST(self):
+        if urlparse(self.path).path.strip("/") != "reload":
+            self._send_error(404, "Unknown endpoint, use /reload.")
+            return
+        self.ledger_service.reload()
+        self._send_json(200, json.dumps({"status": "reloaded"}).encode("utf-8"))
+
+
+def serve(host: str, port: int, ledger_service: LedgerService):
+
+    handler_class = type("BoundLedgerRequestHandler", (LedgerRequestHandler,), {"ledger_service": ledger_service})
+    server = ThreadingHTTPServer((host, port), handler_class)
+    print(f"Serving capital gains and taxable income on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+
+# modules only the commands that evaluate data may load, never the entry point itself
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "googleapiclient", "google_auth_oauthlib", "dotenv", "multiprocessing"]
+
+
+def get_import_times(module: str) -> Tuple[int, Dict[str, int]]:
+    # -X importtime writes "import time: self [us] | cumulative | imported package" lines to stderr
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    ).stderr
+
+    # nested imports are indented and listed before the module that imported them, so the modules imported by
+    # the checked module are the ones listed since the previous top level import, e.g. of the site module
+    cumulative_us = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        cumulative_us[name.strip()] = int(cumulative)
+        if name.strip() == module:
+            break
+        if not name[1:].startswith(" "):
+            cumulative_us = {}
+    return cumulative_us[module], cumulative_us
+
+
+def get_command_seconds(command: List[str], runs: int) -> float:
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, cwd=ROOT_DIR, capture_output=True, check=True)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="Check the import time of the command line entry point.")
+
+    # optional argument
+    arg_parser.add_argument(
+        "--module",
+        type=str,
+        default="main",
+        help="(Optional) Module whose import time is checked. Default = main."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--max_ms",
+        type=float,
+        default=50,
+        help="(Optional) Maximum cumulative import time of the module in milliseconds. Default = 50."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="(Optional) Number of runs of \"main.py --help\", the fastest one is reported. Default = 5."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="(Optional) Number of slowest imports reported. Default = 10."
+    )
+
+    args = arg_parser.parse_args(argv)
+
+    module_us, cumulative_us = get_import_times(args.module)
+    heavy_modules = [module for module in HEAVY_MODULES if module in cumulative_us]
+    result = {
+        "module": args.module,
+        "import_ms": round(module_us / 1000, 2),
+        "max_ms": args.max_ms,
+        "heavy_modules": heavy_modules,
+        "help_seconds": round(get_command_seconds(["main.py", "--help"], args.runs), 4),
+        "slowest_imports": [
+            {"module": name, "cumulative_ms": round(us / 1000, 2)}
+            for name, us in sorted(cumulative_us.items(), key=lambda x: x[1], reverse=True)[:args.top]
+        ],
+        "passed": not heavy_modules and module_us / 1000 <= args.max_ms
+    }
+    print(json.dumps(result))
+
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:])["passed"] else 1)
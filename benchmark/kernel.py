@@ -0,0 +1,97 @@
+import argparse
+import json
+import sys
+import time
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+from evaluate.kernel import KERNELS
+
+EXCLUDE_COLUMNS = ["cryptocurrency", "date_acquired", "date_sold"]
+
+
+def compare_kernels(row_count: int, ticker_count: int, tax_year: int, seed: int) -> dict:
+
+    fiat_currency = "usd"
+    tx_data = TxData(fiat_currency, table=MemoryTable(fiat_currency, generate_ledger(
+        row_count, ticker_count=ticker_count, seed=seed
+    )))
+    # the transaction objects are created before timing, so both kernels only pay for matching and the frame
+    list(tx_data.iter_partitions())
+
+    seconds = {}
+    capital_gains_and_losses_dfs = {}
+    for kernel in KERNELS:
+        taxable_crypto = TaxableCrypto(tax_year=tax_year, fiat_currency=fiat_currency, tx_data=tx_data, kernel=kernel)
+        start = time.perf_counter()
+        capital_gains_and_losses_dfs[kernel] = taxable_crypto.get_capital_gains_and_losses_df(
+            exclude_columns=list(EXCLUDE_COLUMNS)
+        )
+        seconds[kernel] = round(time.perf_counter() - start, 4)
+
+    # the object kernel is the reference, the numpy kernel has to reproduce its rows, values and dtypes exactly
+    reference_df = capital_gains_and_losses_dfs["object"]
+    return {
+        "row_count": row_count,
+        "ticker_count": ticker_count,
+        "tax_year": tax_year,
+        "seed": seed,
+        "taxable_tx_count": len(reference_df),
+        "seconds": seconds,
+        "speedup": round(seconds["object"] / seconds["numpy"], 2) if seconds["numpy"] else None,
+        "equal": all(df.equals(reference_df) for df in capital_gains_and_losses_dfs.values())
+    }
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="Compare the numpy matching kernel with the object kernel.")
+
+    # optional argument
+    arg_parser.add_argument(
+        "--row_counts",
+        "-n",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="(Optional) Numbers of synthetic ledger rows. Default = [1000, 10000, 100000]."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--ticker_count",
+        type=int,
+        default=4,
+        help="(Optional) Number of cryptocurrencies in the synthetic ledgers. Default = 4."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--tax_year",
+        type=int,
+        help="(Optional) Tax year to evaluate, the synthetic ledgers cover 2015 through 2022. Default = None."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--seeds",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="(Optional) Random seeds of the synthetic ledgers. Default = [0]."
+    )
+
+    args = arg_parser.parse_args(argv)
+
+    results = []
+    for row_count in args.row_counts:
+        for seed in args.seeds:
+            results.append(compare_kernels(row_count, args.ticker_count, args.tax_year, seed))
+            print(json.dumps(results[-1]))
+
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if all(result["equal"] for result in main(sys.argv[1:])) else 1)
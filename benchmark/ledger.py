@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import List
+
+import numpy as np
+from pandas import DataFrame, date_range
+
+from data.dao.table import COL_NAME_MAPPING
+
+TICKERS = ["BTC", "ETH", "ADA", "SOL", "DOT", "XRP", "LTC", "DOGE"]
+
+# kinds of synthetic ledger rows, indexing their tx types
+BUY, SELL, TRADE, INCOME, SPEND = range(5)
+TX_TYPES = np.array(["BUY", "SELL", "TRADE", "INTEREST", "PURCHASE"], dtype=object)
+
+
+def get_tickers(ticker_count: int) -> List[str]:
+    return TICKERS[:ticker_count] + [f"C{i:03d}" for i in range(len(TICKERS), ticker_count)]
+
+
+def generate_ledger(row_count: int, ticker_count: int = 4, sell_pct: float = 0.25, trade_pct: float = 0.15,
+                    transact_pct: float = 0.1, partial_fill_pct: float = 0.5, start_year: int = 2015,
+                    years: int = 8, fiat_currency: str = "usd", seed: int = 0) -> DataFrame:
+
+    rng = np.random.default_rng(seed)
+    tickers = np.array(get_tickers(ticker_count), dtype=object)
+    fiat_currency = fiat_currency.upper()
+
+    # rows are spread evenly over the years so that every tax year gets a share of the ledger
+    days = np.arange(row_count, dtype=np.int64) * (years * 365) // max(row_count, 1)
+    day_count = int(days[-1]) + 1 if row_count else 1
+    prices = rng.uniform(1, 1000, ticker_count) * np.exp(
+        np.cumsum(rng.normal(0, 0.03, (day_count, ticker_count)), axis=0)
+    )
+
+    kinds = rng.choice(
+        [BUY, SELL, TRADE, INCOME, SPEND],
+        size=row_count,
+        p=[1 - sell_pct - trade_pct - transact_pct, sell_pct, trade_pct, transact_pct / 2, transact_pct / 2]
+    )
+    # every ticker is bought a few times before anything is sold
+    kinds[:10 * ticker_count] = BUY
+    ticker_from = rng.integers(0, ticker_count, row_count)
+    ticker_to = (ticker_from + rng.integers(1, max(ticker_count, 2), row_count)) % ticker_count
+    ticker_to[kinds != TRADE] = ticker_from[kinds != TRADE]
+
+    # full lots are one unit, partial fills sell a fraction of a unit so that lots are split when matched
+    volume = np.where(
+        (kinds != BUY) & (rng.random(row_count) < partial_fill_pct), rng.uniform(0.05, 0.95, row_count), 1.0
+    )
+    volume[(kinds == INCOME) | (kinds == SPEND)] *= 0.1
+    _fix_overdrawn_holdings(kinds, ticker_from, ticker_to, volume, prices, days, ticker_count)
+
+    price_from = prices[days, ticker_from]
+    price_to = prices[days, ticker_to]
+    # buys and income are priced by the ticker they flow into, everything else by the ticker they flow out of
+    flows_in = (kinds == BUY) | (kinds == INCOME)
+    fiat_value = volume * np.where(flows_in, price_to, price_from)
+
+    currency_in = tickers[ticker_from]
+    currency_in[flows_in] = fiat_currency
+    currency_out = tickers[ticker_to]
+    currency_out[kinds == SELL] = fiat_currency
+    currency_out[kinds == SPEND] = TX_TYPES[SPEND]
+    currency_in_price = np.where(flows_in, 1.0, price_from)
+    currency_out_price = np.where((kinds == SELL) | (kinds == SPEND), 1.0, price_to)
+
+    dates = date_range(datetime(start_year, 1, 1), periods=day_count, freq="D").strftime("%m/%d/%Y")
+    taxable = np.arange(1, row_count + 1).astype(str).astype(object)
+    taxable[kinds == BUY] = "--"
+
+    return DataFrame(OrderedDict(zip(COL_NAME_MAPPING.keys(), [
+        TX_TYPES[kinds],
+        np.asarray(dates, dtype=object)[days],
+        fiat_value,
+        np.round(fiat_value * 0.001, 2),
+        currency_in,
+        currency_in_price,
+        currency_out,
+        currency_out_price,
+        taxable
+    ])), index=np.arange(1, row_count + 1))
+
+
+def _fix_overdrawn_holdings(kinds: np.ndarray, ticker_from: np.ndarray, ticker_to: np.ndarray, volume: np.ndarray,
+                            prices: np.ndarray, days: np.ndarray, ticker_count: int):
+
+    # rows that would sell more than is held are turned into buys, which can overdraw the ticker a trade paid into
+    for _ in range(10):
+        flows_out = (kinds == SELL) | (kinds == TRADE) | (kinds == SPEND)
+        flows_in = (kinds == BUY) | (kinds == TRADE) | (kinds == INCOME)
+        volume_in = np.where(
+            kinds == TRADE, volume * prices[days, ticker_from] / prices[days, ticker_to], volume
+        )
+        overdrawn = np.zeros(len(kinds), dtype=bool)
+        for ticker in range(ticker_count):
+            holdings = np.cumsum(
+                np.where(flows_in & (ticker_to == ticker), volume_in, 0)
+                - np.where(flows_out & (ticker_from == ticker), volume, 0)
+            )
+            overdrawn |= flows_out & (ticker_from == ticker) & (holdings < 1e-3)
+        if not overdrawn.any():
+            return
+        kinds[overdrawn] = BUY
+        ticker_to[overdrawn] = ticker_from[overdrawn]
+    raise ValueError("Could not generate a ledger without overdrawn holdings, lower the sell, trade or spend mix!")
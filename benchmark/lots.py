@@ -0,0 +1,75 @@
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from evaluate.lots import COST_BASIS_METHODS, match_lots
+from models.transactions import Buy, Sell
+
+
+def generate_lots(tx_count: int, seed: int = 0) -> Tuple[List[Buy], List[Sell]]:
+
+    rng = random.Random(seed)
+    timestamp = datetime(2015, 1, 1)
+    holdings = 0
+    txs_in = []
+    txs_out = []
+    for tx_id in range(1, tx_count + 1):
+        timestamp += timedelta(minutes=rng.randint(1, 60))
+        price = rng.uniform(100, 1000)
+        fiat_value = round(rng.uniform(10, 1000), 2)
+        volume = round(fiat_value / price, 8)
+        if holdings < 2 * volume or rng.random() < 0.5:
+            txs_in.append(Buy(tx_id, timestamp, fiat_value, 0, "USD", fiat_value, 1, "BTC", volume, price))
+            holdings += volume
+        else:
+            txs_out.append(Sell(tx_id, timestamp, fiat_value, 0, "BTC", volume, price, "USD", fiat_value, 1))
+            holdings -= volume
+    return txs_in, txs_out
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="Benchmark lot matching per cost basis method.")
+
+    # optional argument
+    arg_parser.add_argument(
+        "--tx_counts",
+        "-n",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="(Optional) Numbers of synthetic transactions to match. Default = [10000, 100000]."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="(Optional) Random seed of the synthetic transactions. Default = 0."
+    )
+
+    args = arg_parser.parse_args(argv)
+
+    results = []
+    for tx_count in args.tx_counts:
+        txs_in, txs_out = generate_lots(tx_count, args.seed)
+        for cost_basis_method, lot_matcher_class in COST_BASIS_METHODS.items():
+            start = time.perf_counter()
+            match_count = sum(1 for _ in match_lots(txs_in, txs_out, lot_matcher_class()))
+            results.append({
+                "cost_basis_method": cost_basis_method,
+                "tx_count": tx_count,
+                "match_count": match_count,
+                "seconds": round(time.perf_counter() - start, 4)
+            })
+            print(json.dumps(results[-1]))
+
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
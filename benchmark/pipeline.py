@@ -0,0 +1,191 @@
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+from evaluate.lots import COST_BASIS_METHODS
+
+
+class StageTimer(object):
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    def run(self, stage: str, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        stage_result = {"stage": stage, "seconds": round(seconds, 4)}
+        if self.trace_memory:
+            stage_result["peak_traced_mib"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+        # ru_maxrss is the high-water mark of the whole process so far, in KiB on Linux
+        stage_result["max_rss_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, 2)
+        self.stages.append(stage_result)
+        return result
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_pipeline(row_count: int, ticker_count: int, cost_basis_method: str, tax_year: int, workers: int,
+                 seed: int, trace_memory: bool = False):
+
+    timer = StageTimer(trace_memory)
+    fiat_currency = "usd"
+
+    raw_df = timer.run("generate", generate_ledger, row_count, ticker_count=ticker_count, seed=seed)
+    table = timer.run("normalize", MemoryTable, fiat_currency, raw_df)
+    del raw_df
+
+    tx_data = TxData(fiat_currency, table=table)
+    # extraction creates the transaction objects, matching reuses them from the table's cached partitions
+    timer.run(
+        "extract",
+        lambda: (
+            tx_data.retrieve_buy_events(tax_year, fiat_currency, "timestamp", "ascending"),
+            tx_data.retrieve_sell_events(tax_year, fiat_currency, "timestamp", "ascending"),
+            tx_data.retrieve_transact_events(tax_year, "timestamp", "ascending")
+        )
+    )
+
+    taxable_crypto = TaxableCrypto(
+        tax_year=tax_year,
+        fiat_currency=fiat_currency,
+        workers=workers,
+        cost_basis_method=cost_basis_method,
+        tx_data=tx_data
+    )
+    capital_gains_and_losses = timer.run("match", taxable_crypto.get_capital_gains_and_losses)
+    timer.run(
+        "dataframe",
+        TaxableCrypto._get_df_from_tx_list,
+        capital_gains_and_losses,
+        ["cryptocurrency", "date_acquired", "date_sold"]
+    )
+
+    return {
+        "row_count": row_count,
+        "ticker_count": ticker_count,
+        "cost_basis_method": cost_basis_method,
+        "tax_year": tax_year,
+        "workers": workers,
+        "seed": seed,
+        "taxable_tx_count": len(capital_gains_and_losses),
+        "stages": timer.stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in timer.stages if stage["stage"] != "generate"), 4)
+    }
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the capital gains pipeline on synthetic ledgers.")
+
+    # optional argument
+    arg_parser.add_argument(
+        "--row_counts",
+        "-n",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="(Optional) Numbers of synthetic ledger rows, up to 10M. Default = [1000, 10000, 100000]."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--ticker_count",
+        type=int,
+        default=4,
+        help="(Optional) Number of cryptocurrencies in the synthetic ledgers. Default = 4."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--cost_basis",
+        type=str,
+        choices=list(COST_BASIS_METHODS.keys()),
+        default="fifo",
+        help="(Optional) Cost basis method used to match lots. Default = fifo."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--tax_year",
+        type=int,
+        help="(Optional) Tax year to evaluate, the synthetic ledgers cover 2015 through 2022. Default = None."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="(Optional) Number of processes used to match lots per cryptocurrency. Default = 1."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="(Optional) Random seed of the synthetic ledgers. Default = 0."
+    )
+
+    # switch
+    arg_parser.add_argument(
+        "--trace_memory",
+        action="store_true",
+        help="(Optional) Report the peak memory allocated per stage with tracemalloc, which slows down every stage. "
+             "Default = False."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--output",
+        type=str,
+        help="(Optional) JSON lines file the results are appended to, e.g. to compare revisions. Default = None."
+    )
+
+    args = arg_parser.parse_args(argv)
+
+    environment = {
+        "revision": get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform()
+    }
+
+    results = []
+    for row_count in args.row_counts:
+        result = dict(environment, **run_pipeline(
+            row_count, args.ticker_count, args.cost_basis, args.tax_year, args.workers, args.seed, args.trace_memory
+        ))
+        results.append(result)
+        print(json.dumps(result))
+        if args.output:
+            with open(args.output, "a") as output_file:
+                output_file.write(json.dumps(result) + "\n")
+
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
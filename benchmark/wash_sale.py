@@ -0,0 +1,150 @@
+import argparse
+import json
+import sys
+import time
+from datetime import timedelta
+from typing import List, Tuple
+
+import numpy as np
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+from evaluate.kernel import to_dates
+from evaluate.lots import RD
+from evaluate.wash_sale import WASH_SALE_DAYS, AcquisitionIndex
+from models.transactions import TaxableTransaction
+
+
+def get_naive_wash_sales(taxable_txs: List[TaxableTransaction],
+                         acquisition_index: AcquisitionIndex) -> Tuple[List[bool], List[int]]:
+
+    # the quadratic check the index replaces, every loss scans every acquisition and sale of its currency
+    window = timedelta(days=WASH_SALE_DAYS)
+    wash_sales = []
+    disallowed_losses = []
+    for taxable_tx in taxable_txs:
+        gain = taxable_tx.capital_gain_or_loss
+        repurchased_volume = 0
+        if gain is not None and gain < 0:
+            date_sold = taxable_tx.date_sold.date()
+            date_acquired = taxable_tx.date_acquired.date()
+            acquisitions = [
+                (timestamp.date(), volume)
+                for timestamp, volume in acquisition_index.get_acquisitions(taxable_tx.cryptocurrency)
+            ]
+            sales = acquisition_index.get_sales(taxable_tx.cryptocurrency)
+            # acquired within the window and still held at the end of the day, or acquired after the sale
+            for day, volume in acquisitions:
+                if date_sold - window <= day <= date_sold + window:
+                    repurchased_volume += volume
+            for lot_day, sale_day, volume in sales:
+                if date_sold - window <= lot_day and sale_day <= date_sold:
+                    repurchased_volume -= volume
+            # the unsold rest of the sold lot is not a replacement
+            if date_acquired >= date_sold - window:
+                repurchased_volume -= sum(volume for day, volume in acquisitions if day == date_acquired)
+                repurchased_volume += sum(
+                    volume for lot_day, sale_day, volume in sales if lot_day == date_acquired and sale_day <= date_sold
+                )
+            repurchased_volume = max(round(repurchased_volume, RD), 0)
+        wash_sale = repurchased_volume > 0
+        wash_sales.append(wash_sale)
+        disallowed_losses.append(
+            round(-gain * min(repurchased_volume / taxable_tx.lot_volume, 1)) if wash_sale else 0
+        )
+    return wash_sales, disallowed_losses
+
+
+def run_wash_sales(row_count: int, ticker_count: int, seed: int, naive_max_rows: int) -> dict:
+
+    fiat_currency = "usd"
+    tx_data = TxData(fiat_currency, table=MemoryTable(fiat_currency, generate_ledger(
+        row_count, ticker_count=ticker_count, seed=seed
+    )))
+    taxable_crypto = TaxableCrypto(fiat_currency=fiat_currency, tx_data=tx_data, wash_sales=True)
+    taxable_txs = taxable_crypto.get_capital_gains_and_losses()
+    acquisition_index = taxable_crypto.acquisition_index
+
+    start = time.perf_counter()
+    wash_sale_columns = acquisition_index.get_wash_sales(
+        [taxable_tx.cryptocurrency for taxable_tx in taxable_txs],
+        to_dates([taxable_tx.date_acquired for taxable_tx in taxable_txs]),
+        to_dates([taxable_tx.date_sold for taxable_tx in taxable_txs]),
+        [taxable_tx.lot_volume for taxable_tx in taxable_txs],
+        [taxable_tx.capital_gain_or_loss for taxable_tx in taxable_txs]
+    )
+    result = {
+        "row_count": row_count,
+        "ticker_count": ticker_count,
+        "seed": seed,
+        "taxable_tx_count": len(taxable_txs),
+        "loss_count": sum(1 for taxable_tx in taxable_txs if (taxable_tx.capital_gain_or_loss or 0) < 0),
+        "wash_sale_count": int(wash_sale_columns["wash_sale"].sum()),
+        "indexed_seconds": round(time.perf_counter() - start, 4),
+        "naive_seconds": None,
+        "equal": None
+    }
+
+    # the naive check is quadratic, so it is only run on ledgers small enough to finish
+    if row_count <= naive_max_rows:
+        start = time.perf_counter()
+        wash_sales, disallowed_losses = get_naive_wash_sales(taxable_txs, acquisition_index)
+        result["naive_seconds"] = round(time.perf_counter() - start, 4)
+        result["equal"] = (
+            np.array_equal(wash_sale_columns["wash_sale"], wash_sales)
+            and np.array_equal(wash_sale_columns["disallowed_loss"], disallowed_losses)
+        )
+    return result
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the wash sale analysis on synthetic ledgers.")
+
+    # optional argument
+    arg_parser.add_argument(
+        "--row_counts",
+        "-n",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="(Optional) Numbers of synthetic ledger rows. Default = [10000, 100000, 1000000]."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--ticker_count",
+        type=int,
+        default=4,
+        help="(Optional) Number of cryptocurrencies in the synthetic ledgers. Default = 4."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="(Optional) Random seed of the synthetic ledgers. Default = 0."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--naive_max_rows",
+        type=int,
+        default=10_000,
+        help="(Optional) Largest ledger also checked with the quadratic scan to compare results. Default = 10000."
+    )
+
+    args = arg_parser.parse_args(argv)
+
+    results = []
+    for row_count in args.row_counts:
+        results.append(run_wash_sales(row_count, args.ticker_count, args.seed, args.naive_max_rows))
+        print(json.dumps(results[-1]))
+
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if all(result["equal"] is not False for result in main(sys.argv[1:])) else 1)
@@ -0,0 +1,52 @@
+import json
+import os
+from hashlib import sha1
+from pathlib import Path
+from typing import Union
+
+from pandas import DataFrame, read_pickle
+
+CACHE_DIR = Path(__file__).parent.parent.parent / "cache"
+CACHE_VERSION = 1
+
+
+class SheetsCache(object):
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _get_file_paths(self, sheet_id: str, sheet_range: str):
+        key = sha1(f"{sheet_id}:{sheet_range}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.pkl"
+
+    def load(self, sheet_id: str, sheet_range: str, revision: str = None) -> Union[DataFrame, None]:
+        metadata_file_path, data_file_path = self._get_file_paths(sheet_id, sheet_range)
+        if not metadata_file_path.exists() or not data_file_path.exists():
+            return None
+
+        with open(metadata_file_path, "r") as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata.get("version") != CACHE_VERSION:
+            return None
+        if revision and metadata["revision"] != revision:
+            return None
+
+        return read_pickle(data_file_path)
+
+    def save(self, sheet_id: str, sheet_range: str, revision: Union[str, None], data: DataFrame):
+
+        if not self.cache_dir.exists():
+            os.makedirs(self.cache_dir)
+
+        metadata_file_path, data_file_path = self._get_file_paths(sheet_id, sheet_range)
+        if metadata_file_path.exists():
+            os.remove(metadata_file_path)
+        # metadata is written last so an interrupted save is never picked up as a valid snapshot
+        data.to_pickle(data_file_path)
+        with open(metadata_file_path, "w") as metadata_file:
+            json.dump({
+                "version": CACHE_VERSION,
+                "sheet_id": sheet_id,
+                "sheet_range": sheet_range,
+                "revision": revision
+            }, metadata_file, indent=2)
@@ -0,0 +1,95 @@
+import json
+import os
+from pathlib import Path
+from threading import Lock, local
+from typing import Dict, List, Tuple, Union
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build, Resource
+from httplib2 import Http
+
+AUTH_DIR = Path(__file__).parent.parent.parent / "auth"
+
+# If modifying these scopes, delete the file token.json
+# scopes can be found here: https://developers.google.com/identity/protocols/oauth2/scopes
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    "https://www.googleapis.com/auth/drive.metadata.readonly"
+]
+
+
+class GoogleClientProvider(object):
+
+    def __init__(self, auth_dir: Path = AUTH_DIR, scopes: List[str] = None):
+        self.auth_dir = auth_dir
+        self.scopes = scopes if scopes else SCOPES
+        self._creds = None  # type: Union[Credentials, None]
+        self._creds_lock = Lock()
+        # httplib2 is not thread-safe, so every thread gets its own session and the services built on it
+        self._thread_local = local()
+
+    def get_credentials(self) -> Credentials:
+
+        with self._creds_lock:
+            if self._creds is not None and self._creds.valid:
+                return self._creds
+
+            credentials_file_path = self.auth_dir / "credentials.json"
+            token_file_path = self.auth_dir / "token.json"
+            if not self.auth_dir.exists():
+                os.makedirs(self.auth_dir)
+
+            creds = self._creds
+            # The file token.json stores the user's access and refresh tokens, and is
+            # created automatically when the authorization flow completes for the first
+            # time.
+            # The token keeps the scopes it was granted, a refresh cannot widen them, so new scopes are only asked
+            # for when the user logs in again.
+            if creds is None and token_file_path.exists():
+                creds = Credentials.from_authorized_user_file(str(token_file_path))
+            # If there are no (valid) credentials available, let the user log in.
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    try:
+                        creds.refresh(Request())
+                    except RefreshError:
+                        creds = None
+                if not creds or not creds.valid:
+                    flow = InstalledAppFlow.from_client_secrets_file(str(credentials_file_path), self.scopes)
+                    creds = flow.run_local_server(port=0)
+                # Save the credentials for the next run
+                with open(token_file_path, "w") as token:
+                    json.dump(json.loads(creds.to_json()), token, indent=2)
+
+            self._creds = creds
+            return creds
+
+    def get_http(self) -> AuthorizedHttp:
+        # the session refreshes expired credentials by itself before each request
+        if getattr(self._thread_local, "http", None) is None:
+            self._thread_local.http = AuthorizedHttp(self.get_credentials(), http=Http())
+        return self._thread_local.http
+
+    def get_service(self, service_name: str, version: str) -> Resource:
+
+        services = getattr(self._thread_local, "services", None)  # type: Dict[Tuple[str, str], Resource]
+        if services is None:
+            services = self._thread_local.services = {}
+
+        if (service_name, version) not in services:
+            # the discovery document shipped with the client library is used instead of fetching it every time
+            services[(service_name, version)] = build(
+                service_name, version, http=self.get_http(), cache_discovery=False, static_discovery=True
+            )
+        return services[(service_name, version)]
+
+    def reset(self):
+        self._creds = None
+        self._thread_local = local()
+
+
+CLIENT_PROVIDER = GoogleClientProvider()
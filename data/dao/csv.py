@@ -0,0 +1,63 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Union
+
+from pandas import DataFrame, read_csv
+
+from data.dao.table import BaseTable, COL_NAME_MAPPING, get_file_version
+from models.transactions import Buy, Sell, Trade, Transact
+
+RAW_COL_DTYPES = {
+    "Tx Type": str,
+    "Tx Date": str,
+    "Tx Cost": str,
+    "Fee": str,
+    "Currency (FROM)": str,
+    "Daily Avg. (FROM)": str,
+    "Currency (TO)": str,
+    "Daily Avg. (TO)": str,
+    "Taxable Event Tx #": str
+}
+
+
+class CsvTable(BaseTable):
+
+    def __init__(self, fiat_currency: str, file_path: Union[str, Path], chunk_size: int = None):
+        super().__init__(fiat_currency=fiat_currency)
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+
+        # chunked tables are streamed through iter_partitions instead of being loaded up front
+        if chunk_size:
+            return
+
+        raw_df = self._read_csv()
+        raw_df = raw_df[raw_df["Tx Type"].notna()].reset_index(drop=True)
+        raw_df.index += 1
+
+        self._set_data_from_raw_df(raw_df)
+
+    def _read_csv(self, chunk_size: int = None) -> Union[DataFrame, Iterator[DataFrame]]:
+        # only the mapped columns are parsed, numbers are read as text and converted like the cells of every other
+        # data source, so that invalid cells are reported, and only empty cells are missing, not e.g. "n/a"
+        return read_csv(
+            self.file_path,
+            usecols=list(COL_NAME_MAPPING.keys()),
+            dtype=RAW_COL_DTYPES,
+            keep_default_na=False,
+            na_values=[""],
+            memory_map=True,
+            chunksize=chunk_size
+        )
+
+    def get_source_version(self) -> str:
+        return get_file_version(self.file_path)
+
+    def get_source_id(self) -> str:
+        return str(Path(self.file_path).resolve())
+
+    def iter_partitions(self) -> Iterator[Dict[str, List[Union[Buy, Sell, Trade, Transact]]]]:
+        if not self.chunk_size:
+            yield from super().iter_partitions()
+        else:
+            with self._read_csv(self.chunk_size) as raw_df_chunks:
+                yield from self._iter_raw_df_partitions(raw_df_chunks)
@@ -0,0 +1,15 @@
+from pandas import DataFrame
+
+from data.dao.table import BaseTable
+
+
+class MemoryTable(BaseTable):
+
+    def __init__(self, fiat_currency: str, raw_df: DataFrame):
+        super().__init__(fiat_currency=fiat_currency)
+
+        # raw_df has the same columns as the ledger export, e.g. the rows of a Google Sheet or a CSV file
+        raw_df = raw_df[raw_df["Tx Type"].notna()].reset_index(drop=True)
+        raw_df.index += 1
+
+        self._set_data_from_raw_df(raw_df)
@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Union
+
+from pandas import read_parquet
+
+from data.dao.table import BaseTable, COL_NAME_MAPPING, get_file_version
+from models.transactions import Buy, Sell, Trade, Transact
+
+
+class ParquetTable(BaseTable):
+
+    def __init__(self, fiat_currency: str, file_path: Union[str, Path], chunk_size: int = None):
+        super().__init__(fiat_currency=fiat_currency)
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+
+        # chunked tables are streamed through iter_partitions instead of being loaded up front
+        if chunk_size:
+            return
+
+        # requires pyarrow, only the mapped columns are read and the file is memory-mapped instead of copied
+        raw_df = read_parquet(
+            file_path,
+            engine="pyarrow",
+            columns=list(COL_NAME_MAPPING.keys()),
+            memory_map=True
+        )
+        raw_df = raw_df[raw_df["Tx Type"].notna()].reset_index(drop=True)
+        raw_df.index += 1
+
+        self._set_data_from_raw_df(raw_df)
+
+    def get_source_version(self) -> str:
+        return get_file_version(self.file_path)
+
+    def get_source_id(self) -> str:
+        return str(Path(self.file_path).resolve())
+
+    def iter_partitions(self) -> Iterator[Dict[str, List[Union[Buy, Sell, Trade, Transact]]]]:
+        if not self.chunk_size:
+            yield from super().iter_partitions()
+        else:
+            from pyarrow.parquet import ParquetFile
+
+            parquet_file = ParquetFile(self.file_path, memory_map=True)
+            yield from self._iter_raw_df_partitions(
+                record_batch.to_pandas()
+                for record_batch in parquet_file.iter_batches(
+                    batch_size=self.chunk_size, columns=list(COL_NAME_MAPPING.keys())
+                )
+            )
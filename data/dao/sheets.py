@@ -1,17 +1,14 @@
-import json
-import os
 from collections import OrderedDict
-from decimal import Decimal
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from pandas import options, to_datetime, DataFrame
+from pandas import options, concat, DataFrame
 
+from data.dao.cache import SheetsCache
+from data.dao.client import CLIENT_PROVIDER, GoogleClientProvider
 from data.dao.table import BaseTable
+from utils.profiler import profile_stage, stage
 
 RD = 8
 
@@ -19,145 +16,166 @@ RD = 8
 class SheetsTable(BaseTable):
 
     def __init__(self, fiat_currency: str, sheet_id: str, tab_name: str, starting_range_col: str,
-                 ending_range_col: str, starting_range_row: str = "", ending_range_row: str = ""):
+                 ending_range_col: str, starting_range_row: str = "", ending_range_row: str = "",
+                 offline: bool = False, service=None, drive_service=None, cache: SheetsCache = None,
+                 sheet_ranges: List[Tuple[str, str]] = None, workers: int = 1,
+                 client_provider: GoogleClientProvider = None):
         super().__init__(fiat_currency=fiat_currency)
 
-        # If modifying these scopes, delete the file token.json
-        # scopes can be found here: https://developers.google.com/identity/protocols/oauth2/scopes
-        scopes = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
-
-        google_auth_dir = Path(__file__).parent.parent.parent / "auth"
-        credentials_file_path = google_auth_dir / "credentials.json"
-        if not google_auth_dir.exists():
-            os.makedirs(google_auth_dir)
-        token_file_path = google_auth_dir / "token.json"
-
-        creds = None
-        # The file token.json stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if token_file_path.exists():
-            creds = Credentials.from_authorized_user_file(str(token_file_path), scopes)
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(str(credentials_file_path), scopes)
-                with open(credentials_file_path, "r+") as cred_file:
-                    cred_json = json.load(cred_file)
-                    cred_file.seek(0)
-                    cred_file.truncate()
-                    json.dump(cred_json, cred_file, indent=2)
-
-                creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open(token_file_path, "w") as token:
-                json.dump(json.loads(creds.to_json()), token, indent=2)
+        # (sheet id, range) pairs, e.g. one tab per exchange and year, merged into one table spreadsheet by spreadsheet
+        sheet_ranges = sheet_ranges if sheet_ranges else [(
+            sheet_id, f"{tab_name}!{starting_range_col}{starting_range_row}:{ending_range_col}{ending_range_row}"
+        )]
+        ranges_by_sheet = OrderedDict()  # type: Dict[str, List[str]]
+        for range_sheet_id, sheet_range in sheet_ranges:
+            ranges_by_sheet.setdefault(range_sheet_id, []).append(sheet_range)
+        cache_sheet_id, cache_sheet_range = self._get_cache_key(ranges_by_sheet)
+        cache = cache if cache else SheetsCache()
+        self._ranges_by_sheet = ranges_by_sheet
+        self._drive_service = None
+        self._client_provider = None  # type: Union[GoogleClientProvider, None]
+
+        if offline:
+            with stage("cache"):
+                self.data = cache.load(cache_sheet_id, cache_sheet_range)
+            if self.data is None:
+                raise FileNotFoundError(
+                    f"No cached data found for sheet {cache_sheet_id} ({cache_sheet_range}), "
+                    f"run once without offline mode!"
+                )
+            self._index_data_columns()
+            return
+
+        # injected services are used as they are, provided ones are cached per thread and reused across tables
+        client_provider = client_provider if client_provider else CLIENT_PROVIDER
+        provided = service is None
+        if provided:
+            with stage("oauth"):
+                service = client_provider.get_service("sheets", "v4")
+                drive_service = client_provider.get_service("drive", "v3")
+            self._client_provider = client_provider
+        else:
+            self._drive_service = drive_service
 
         try:
-            service = build("sheets", "v4", credentials=creds)
-
-            sheet_range = f"{tab_name}!{starting_range_col}{starting_range_row}:{ending_range_col}{ending_range_row}"
-
-            # Call the Sheets API
-            sheet = service.spreadsheets()
-            # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/get
-            result = sheet.values().get(
-                spreadsheetId=sheet_id,
-                range=sheet_range,
-                valueRenderOption="UNFORMATTED_VALUE",
-                dateTimeRenderOption="FORMATTED_STRING"
-            ).execute()
-            values = result.get("values", [])
-
-            if not values:
+            with stage("fetch"):
+                revision = self._get_revisions(drive_service, ranges_by_sheet)
+            with stage("cache"):
+                cached_data = cache.load(cache_sheet_id, cache_sheet_range, revision) if revision else None
+            if cached_data is not None:
+                self.data = cached_data
+                self._index_data_columns()
+                return
+
+            # Call the Sheets API, one batchGet per spreadsheet
+            with stage("fetch") as fetch_stage:
+                if workers > 1 and len(ranges_by_sheet) > 1:
+                    with ThreadPoolExecutor(max_workers=min(workers, len(ranges_by_sheet))) as executor:
+                        sheet_value_ranges = list(executor.map(
+                            lambda item: self._get_value_ranges(
+                                client_provider.get_service("sheets", "v4") if provided else service, *item
+                            ),
+                            ranges_by_sheet.items()
+                        ))
+                else:
+                    sheet_value_ranges = [
+                        self._get_value_ranges(service, range_sheet_id, sheet_range_list)
+                        for range_sheet_id, sheet_range_list in ranges_by_sheet.items()
+                    ]
+                value_ranges = [values for value_range_list in sheet_value_ranges for values in value_range_list]
+                fetch_stage.add_rows(sum(len(values) for values in value_ranges))
+
+            if not any(value_ranges):
                 print("No data found.")
             else:
-                options.display.float_format = f"{{:.{RD}f}}".format
-
-                cleaned_data = []
-                for row in values:
-                    if row and row[0] != "":
-                        cleaned_data.append(
-                            [str.replace(cell, "\n", " ") if isinstance(cell, str) else cell for cell in row]
-                        )
-
-                raw_df = DataFrame(cleaned_data[1:], columns=cleaned_data[0])
-                raw_df.index += 1
-
-                taxable_tx_types = set(raw_df[raw_df["Taxable Event Tx #"] != "--"]["Tx Type"].tolist())
-                # print(raw_df.head(2).to_string())
-
-                col_name_mapping = OrderedDict([
-                    ("Tx Type", "tx_type"),
-                    ("Tx Date", "tx_timestamp"),
-                    ("Tx Cost", "fiat_value"),
-                    ("Fee", "fiat_tx_fee"),
-                    ("Currency (FROM)", "currency_in"),
-                    ("Daily Avg. (FROM)", "currency_in_fiat_price"),
-                    # ("Tx Volume (FROM)", "currency_in_volume"),
-                    ("Currency (TO)", "currency_out"),
-                    ("Daily Avg. (TO)", "currency_out_fiat_price"),
-                    # ("Tx Volume (TO)", "currency_out_volume"),
-                    ("Taxable Event Tx #", "tx_taxable")
-                ])
-
-                self.data = raw_df[col_name_mapping.keys()].copy()
-
-                for i, col_name in enumerate(self.data.columns, start=1):
-                    if col_name in col_name_mapping.keys():
-                        self.data_col_index_map[col_name_mapping[col_name]] = i
-
-                self.data.columns = self.data_col_index_map.keys()
-                self.data["tx_timestamp"] = self.data["tx_timestamp"].apply(
-                    lambda x: to_datetime(x, format="%m/%d/%Y")
-                )
-                self.data["fiat_value"] = self.data["fiat_value"].apply(
-                    lambda x: abs(float(Decimal(x)))
-                )
-                self.data["fiat_tx_fee"] = self.data["fiat_tx_fee"].apply(
-                    lambda x: abs(float(Decimal(x)))
-                )
-                self.data["currency_in"] = self.data["currency_in"].str.upper()
-                self.data["currency_in_fiat_price"] = self.data["currency_in_fiat_price"].apply(
-                    lambda x: abs(float(Decimal(x)))
-                )
-                self.data["currency_out"] = self.data["currency_out"].str.upper()
-                self.data["currency_out_fiat_price"] = self.data["currency_out_fiat_price"].apply(
-                    lambda x: abs(float(Decimal(x)))
-                )
-                self.data["tx_taxable"] = self.data["tx_taxable"] != "--"
-                self.data["currency_in_volume"] = self.data["fiat_value"] / self.data["currency_in_fiat_price"]
-                # self.data.loc[
-                #     self.data["currency_in_fiat_price"] > 0,
-                #     "currency_in_volume"
-                # ] = self.data["fiat_value"] / self.data["currency_in_fiat_price"]
-                self.data_col_index_map["currency_in_volume"] = max(self.data_col_index_map.values()) + 1
-
-                self.data["currency_out_volume"] = self.data["fiat_value"] / self.data["currency_out_fiat_price"]
-                # self.data.loc[
-                #     self.data["currency_out_fiat_price"] > 0,
-                #     "currency_out_volume"
-                # ] = self.data["fiat_value"] / self.data["currency_out_fiat_price"]
-                self.data_col_index_map["currency_out_volume"] = max(self.data_col_index_map.values()) + 1
-
-                self.data["description"] = ""
-                self.data.loc[
-                    (self.data.tx_type.isin(taxable_tx_types))
-                    &
-                    (~self.data.tx_type.isin(["BUY", "SELL", "TRADE"])),
-                    "description"
-                ] = self.data["tx_type"]
-                self.data.loc[self.data["description"] == "", "description"] = None
-                self.data_col_index_map["description"] = max(self.data_col_index_map.values()) + 1
-
-                self.data.loc[
-                    (self.data.tx_type.isin(taxable_tx_types))
-                    &
-                    (~self.data.tx_type.isin(["BUY", "SELL", "TRADE"])),
-                    "tx_type"
-                ] = "TRANSACT"
+                self._set_data(value_ranges)
+                with stage("cache"):
+                    cache.save(cache_sheet_id, cache_sheet_range, revision, self.data)
 
         except HttpError as err:
             print(err)
+
+    @staticmethod
+    def _get_cache_key(ranges_by_sheet: Dict[str, List[str]]) -> Tuple[str, str]:
+        # a single spreadsheet keeps the key of its plain range, so existing snapshots stay valid
+        if len(ranges_by_sheet) == 1:
+            sheet_id, sheet_ranges = next(iter(ranges_by_sheet.items()))
+            return sheet_id, ",".join(sheet_ranges)
+        return ",".join(ranges_by_sheet.keys()), ",".join(
+            f"{sheet_id}:{sheet_range}"
+            for sheet_id, sheet_ranges in ranges_by_sheet.items()
+            for sheet_range in sheet_ranges
+        )
+
+    @staticmethod
+    def _get_value_ranges(service, sheet_id: str, sheet_ranges: List[str]) -> List[List[list]]:
+
+        # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/batchGet
+        result = service.spreadsheets().values().batchGet(
+            spreadsheetId=sheet_id,
+            ranges=sheet_ranges,
+            valueRenderOption="UNFORMATTED_VALUE",
+            dateTimeRenderOption="FORMATTED_STRING"
+        ).execute()
+        return [value_range.get("values", []) for value_range in result.get("valueRanges", [])]
+
+    def get_source_version(self) -> Union[str, None]:
+        # offline tables cannot see changes, provided services are not shared across threads
+        if self._client_provider is not None:
+            return self._get_revisions(self._client_provider.get_service("drive", "v3"), self._ranges_by_sheet)
+        return self._get_revisions(self._drive_service, self._ranges_by_sheet)
+
+    def get_source_id(self) -> str:
+        return ",".join(
+            f"{sheet_id}:{sheet_range}"
+            for sheet_id, sheet_ranges in self._ranges_by_sheet.items()
+            for sheet_range in sheet_ranges
+        )
+
+    @staticmethod
+    def _get_revisions(drive_service, ranges_by_sheet: Dict[str, List[str]]) -> Union[str, None]:
+        revisions = [SheetsTable._get_revision(drive_service, sheet_id) for sheet_id in ranges_by_sheet]
+        # the snapshot is only valid while none of the spreadsheets has changed
+        return ",".join(revisions) if all(revisions) else None
+
+    @staticmethod
+    def _get_revision(drive_service, sheet_id: str) -> Union[str, None]:
+
+        if drive_service is None:
+            return None
+
+        try:
+            # https://developers.google.com/drive/api/reference/rest/v3/files/get
+            result = drive_service.files().get(fileId=sheet_id, fields="modifiedTime").execute()
+            return result.get("modifiedTime")
+        except HttpError:
+            # tokens created before the drive metadata scope was added cannot read the revision
+            return None
+
+    @profile_stage("clean", rows=lambda self, value_ranges: sum(len(values) for values in value_ranges))
+    def _set_data(self, value_ranges: List[List[list]]):
+
+        options.display.float_format = f"{{:.{RD}f}}".format
+
+        # every range starts with its own header row, columns are aligned by name when the ranges are merged
+        raw_df = concat(
+            [self._get_raw_df(values) for values in value_ranges if values], ignore_index=True
+        )
+        raw_df.index += 1
+
+        self._set_data_from_raw_df(raw_df)
+
+    @staticmethod
+    def _get_raw_df(values: List[list]) -> DataFrame:
+
+        # ragged rows are padded with None, rows without a first cell are blank or notes and are dropped
+        raw_df = DataFrame(values)
+        raw_df = raw_df[raw_df[0].notna() & (raw_df[0] != "")]
+        for col in raw_df.columns:
+            if raw_df[col].dtype == object:
+                has_newline = raw_df[col].str.contains("\n", regex=False).fillna(False).astype(bool)
+                if has_newline.any():
+                    raw_df[col] = raw_df[col].mask(has_newline, raw_df[col].str.replace("\n", " ", regex=False))
+
+        raw_df.columns = raw_df.iloc[0].tolist()
+        return raw_df.iloc[1:].infer_objects()
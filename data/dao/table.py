@@ -1,15 +1,52 @@
+import os
 from abc import ABC, abstractmethod
 from collections import OrderedDict
+from datetime import datetime
 from itertools import chain
-from typing import Union, List, Type
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Union, List, Type
 
-from pandas import DataFrame, to_datetime
+import numpy as np
+from pandas import DataFrame, RangeIndex, Series, concat, to_datetime, to_numeric
 
 from models.attributes import TxType
 from models.transactions import Buy, Sell, Trade, Transact
+from utils.profiler import profile_stage
 
 RD = 8
 
+# raw ledger export columns (Google Sheets, CSV, Parquet) mapped to normalized data columns
+COL_NAME_MAPPING = OrderedDict([
+    ("Tx Type", "tx_type"),
+    ("Tx Date", "tx_timestamp"),
+    ("Tx Cost", "fiat_value"),
+    ("Fee", "fiat_tx_fee"),
+    ("Currency (FROM)", "currency_in"),
+    ("Daily Avg. (FROM)", "currency_in_fiat_price"),
+    # ("Tx Volume (FROM)", "currency_in_volume"),
+    ("Currency (TO)", "currency_out"),
+    ("Daily Avg. (TO)", "currency_out_fiat_price"),
+    # ("Tx Volume (TO)", "currency_out_volume"),
+    ("Taxable Event Tx #", "tx_taxable")
+])
+
+DATE_FORMAT = "%m/%d/%Y"
+NUMERIC_COLUMNS = ["fiat_value", "fiat_tx_fee", "currency_in_fiat_price", "currency_out_fiat_price"]
+# number of invalid cells listed in the error message, all of them are kept in BaseTable.invalid_cells
+INVALID_CELLS_SHOWN = 20
+
+TX_TYPE_CLASSES = OrderedDict([
+    (TxType.BUY.value, Buy),
+    (TxType.SELL.value, Sell),
+    (TxType.TRADE.value, Trade),
+    (TxType.TRANSACT.value, Transact)
+])
+
+
+def get_file_version(file_path: Union[str, Path]) -> str:
+    file_stat = os.stat(file_path)
+    return f"{file_stat.st_mtime_ns}-{file_stat.st_size}"
+
 
 class BaseTable(ABC):
 
@@ -20,123 +57,350 @@ class BaseTable(ABC):
         self.fiat_currency = fiat_currency.upper()
         self.cryptocurrencies = set()
         self._tx_count = 1
+        self._partitions = None  # type: Union[Dict[str, List[Union[Buy, Sell, Trade, Transact]]], None]
+        self._taxable_tx_types = set()
+        # transactions before the start date are ignored, e.g. when resuming from the prior year's open lots
+        self.start_date = None  # type: Union[datetime, None]
+        self.invalid_cells = None  # type: Union[DataFrame, None]
+        # fills missing and zero prices, e.g. a data.prices.PriceStore, ledger prices are used as they are if None
+        self.price_store = None
+
+    def _set_data_from_raw_df(self, raw_df: DataFrame):
+        self.data = self._normalize_raw_df(raw_df)
+
+    @profile_stage("normalize", rows=lambda self, raw_df: len(raw_df))
+    def _normalize_raw_df(self, raw_df: DataFrame) -> DataFrame:
+
+        # taxable tx types are remembered across calls so that chunks of one ledger are classified consistently
+        self._taxable_tx_types.update(raw_df[raw_df["Taxable Event Tx #"] != "--"]["Tx Type"].tolist())
+        taxable_tx_types = self._taxable_tx_types
+        # print(raw_df.head(2).to_string())
+
+        self.data_col_index_map = OrderedDict()
+        data = raw_df[COL_NAME_MAPPING.keys()].copy()
+
+        for i, col_name in enumerate(data.columns, start=1):
+            if col_name in COL_NAME_MAPPING.keys():
+                self.data_col_index_map[COL_NAME_MAPPING[col_name]] = i
+
+        data.columns = self.data_col_index_map.keys()
+        self._convert_columns(data)
+        data["currency_in"] = data["currency_in"].str.upper()
+        data["currency_out"] = data["currency_out"].str.upper()
+        data["tx_taxable"] = data["tx_taxable"] != "--"
+        data["currency_in_volume"] = data["fiat_value"] / data["currency_in_fiat_price"]
+        # data.loc[
+        #     data["currency_in_fiat_price"] > 0,
+        #     "currency_in_volume"
+        # ] = data["fiat_value"] / data["currency_in_fiat_price"]
+        self.data_col_index_map["currency_in_volume"] = max(self.data_col_index_map.values()) + 1
+
+        data["currency_out_volume"] = data["fiat_value"] / data["currency_out_fiat_price"]
+        # data.loc[
+        #     data["currency_out_fiat_price"] > 0,
+        #     "currency_out_volume"
+        # ] = data["fiat_value"] / data["currency_out_fiat_price"]
+        self.data_col_index_map["currency_out_volume"] = max(self.data_col_index_map.values()) + 1
+
+        data["description"] = ""
+        data.loc[
+            (data.tx_type.isin(taxable_tx_types))
+            &
+            (~data.tx_type.isin(["BUY", "SELL", "TRADE"])),
+            "description"
+        ] = data["tx_type"]
+        data.loc[data["description"] == "", "description"] = None
+        self.data_col_index_map["description"] = max(self.data_col_index_map.values()) + 1
+
+        data.loc[
+            (data.tx_type.isin(taxable_tx_types))
+            &
+            (~data.tx_type.isin(["BUY", "SELL", "TRADE"])),
+            "tx_type"
+        ] = "TRANSACT"
+
+        return data
+
+    def _convert_columns(self, data: DataFrame):
+
+        invalid_cells = []
+        timestamps = to_datetime(data["tx_timestamp"], format=DATE_FORMAT, errors="coerce")
+        invalid_cells.append(self._get_invalid_cells(data["tx_timestamp"], timestamps.isna()))
+        data["tx_timestamp"] = timestamps
+
+        for col_name in NUMERIC_COLUMNS:
+            col = data[col_name]
+            if col.dtype != "float64":
+                # float() also accepts e.g. "1_000" or non-ASCII digits, so cells are validated by the strict parser
+                # first, it is not correctly rounded though, so the values themselves are still converted by float()
+                col_invalid_cells = self._get_invalid_cells(col, to_numeric(col, errors="coerce").isna())
+                if not col_invalid_cells.empty:
+                    invalid_cells.append(col_invalid_cells)
+                    continue
+                col = col.astype("float64")
+            data[col_name] = col.abs()
+
+        self._check_invalid_cells(concat(invalid_cells))
+
+    def _check_invalid_cells(self, invalid_cells: DataFrame):
+        if not invalid_cells.empty:
+            self.invalid_cells = invalid_cells
+            raise ValueError(
+                f"{len(invalid_cells)} invalid cells found, check data!\n"
+                f"{invalid_cells.head(INVALID_CELLS_SHOWN).to_string(index=False)}"
+            )
+
+    def fill_prices(self, price_store):
+        self.price_store = price_store
+        # chunked tables fill the prices of every chunk as it is streamed instead
+        if self.data is not None:
+            self.data = self._fill_prices(self.data)
+            self._partitions = None
+
+    @profile_stage("prices", rows=lambda self, data: len(data))
+    def _fill_prices(self, data: DataFrame) -> DataFrame:
+
+        invalid_cells = []
+        for flow, raw_col_name in [("in", "Daily Avg. (FROM)"), ("out", "Daily Avg. (TO)")]:
+            currencies = data[f"currency_{flow}"]
+            prices = data[f"currency_{flow}_fiat_price"]
+            # a zero or missing price would turn the volume into inf or NaN
+            missing = (prices.isna() | (prices == 0)) & (currencies != self.fiat_currency)
+            if not missing.any():
+                continue
+
+            filled_prices = self.price_store.get_prices(
+                currencies[missing].values, data.loc[missing, "tx_timestamp"].values, self.fiat_currency
+            )
+            data.loc[missing, f"currency_{flow}_fiat_price"] = filled_prices
+            data.loc[missing, f"currency_{flow}_volume"] = data.loc[missing, "fiat_value"] / filled_prices
+
+            unresolved = data.loc[missing][np.isnan(filled_prices)]
+            invalid_cells.append(DataFrame({
+                "row": unresolved.index,
+                "column": raw_col_name,
+                "value": [
+                    f"no {self.fiat_currency} price of {currency} on {timestamp:%m/%d/%Y}"
+                    for currency, timestamp in zip(unresolved[f"currency_{flow}"], unresolved["tx_timestamp"])
+                ]
+            }))
+
+        if invalid_cells:
+            self._check_invalid_cells(concat(invalid_cells))
+        return data
+
+    @staticmethod
+    def _get_invalid_cells(col: Series, unparsed: Series) -> DataFrame:
+        # missing cells are not invalid, they stay NaN/NaT as before
+        invalid = col[unparsed & col.notna()]
+        raw_col_name = next(raw for raw, name in COL_NAME_MAPPING.items() if name == col.name)
+        return DataFrame({
+            "row": invalid.index,
+            "column": raw_col_name,
+            "value": invalid.astype(str).values
+        })
+
+    def get_source_version(self) -> Union[str, None]:
+        # changes whenever the data source changes, None when changes cannot be detected
+        return None
+
+    def get_source_id(self) -> Union[str, None]:
+        # identifies the ledger, e.g. its file path, None when it has no location, e.g. an in-memory ledger
+        return None
+
+    def _index_data_columns(self):
+        self.data_col_index_map = OrderedDict(
+            (col_name, i) for i, col_name in enumerate(self.data.columns, start=1)
+        )
+
+    def _get_tx_columns(self, df: DataFrame) -> Dict[str, list]:
+
+        tx_columns = {
+            "tx_timestamp": df["tx_timestamp"].tolist(),
+            "currency_in": df["currency_in"].str.upper().tolist(),
+            "currency_out": df["currency_out"].str.upper().tolist(),
+            "tx_taxable": df["tx_taxable"].tolist(),
+            "description": df["description"].tolist()
+        }
+        for col_name in ["fiat_value", "fiat_tx_fee", "currency_in_fiat_price", "currency_in_volume",
+                         "currency_out_fiat_price", "currency_out_volume"]:
+            tx_columns[col_name] = df[col_name].astype(float).round(RD).tolist()
+
+        tickers = set(df["currency_out"].str.lower().unique())
+        tickers.discard(self.fiat_currency.lower())
+        self.cryptocurrencies.update(tickers)
+
+        return tx_columns
 
     def _create_tx_class_instance_list(self, class_type: Type,
                                        df: DataFrame) -> List[Union[Buy, Sell, Trade, Transact]]:
 
-        txs = []
-        for row in df.itertuples():
-            txs.append(class_type(
-                tx_id=self._tx_count,
-                timestamp=row[self.data_col_index_map["tx_timestamp"]],
-                fiat_value=round(float(row[self.data_col_index_map["fiat_value"]]), RD),
-                fiat_tx_fee=round(float(row[self.data_col_index_map["fiat_tx_fee"]]), RD),
-                currency_in=row[self.data_col_index_map["currency_in"]],
-                currency_in_fiat_price=round(float(row[self.data_col_index_map["currency_in_fiat_price"]]), RD),
-                currency_in_volume=round(float(row[self.data_col_index_map["currency_in_volume"]]), RD),
-                currency_out=row[self.data_col_index_map["currency_out"]],
-                currency_out_fiat_price=round(float(row[self.data_col_index_map["currency_out_fiat_price"]]), RD),
-                currency_out_volume=round(float(row[self.data_col_index_map["currency_out_volume"]]), RD),
-                taxable=row[self.data_col_index_map["tx_taxable"]],
-                description=row[self.data_col_index_map["description"]]
-            ))
-            ticker = str.lower(row[self.data_col_index_map["currency_out"]])
-            if ticker != self.fiat_currency.lower():
-                self.cryptocurrencies.add(str.lower(row[self.data_col_index_map["currency_out"]]))
-            self._tx_count += 1
+        tx_columns = self._get_tx_columns(df)
+        txs = [
+            class_type(
+                tx_id=tx_id,
+                timestamp=timestamp,
+                fiat_value=fiat_value,
+                fiat_tx_fee=fiat_tx_fee,
+                currency_in=currency_in,
+                currency_in_fiat_price=currency_in_fiat_price,
+                currency_in_volume=currency_in_volume,
+                currency_out=currency_out,
+                currency_out_fiat_price=currency_out_fiat_price,
+                currency_out_volume=currency_out_volume,
+                taxable=taxable,
+                description=description
+            )
+            for (tx_id, timestamp, fiat_value, fiat_tx_fee, currency_in, currency_in_fiat_price, currency_in_volume,
+                 currency_out, currency_out_fiat_price, currency_out_volume, taxable, description) in zip(
+                range(self._tx_count, self._tx_count + len(df)),
+                tx_columns["tx_timestamp"],
+                tx_columns["fiat_value"],
+                tx_columns["fiat_tx_fee"],
+                tx_columns["currency_in"],
+                tx_columns["currency_in_fiat_price"],
+                tx_columns["currency_in_volume"],
+                tx_columns["currency_out"],
+                tx_columns["currency_out_fiat_price"],
+                tx_columns["currency_out_volume"],
+                tx_columns["tx_taxable"],
+                tx_columns["description"]
+            )
+        ]
+        self._tx_count += len(df)
         return txs
 
-    def _get_transactions(self, tx_type: str, tx_type_class: Type, tax_year: int, sort_field: str,
+    @profile_stage("extract", rows=lambda self, df: len(df))
+    def _partition_df(self, df: DataFrame) -> Dict[str, List[Union[Buy, Sell, Trade, Transact]]]:
+
+        df = df.assign(tx_timestamp=to_datetime(df["tx_timestamp"], format="%m/%d/%Y"))
+        if self.start_date is not None:
+            df = df[df["tx_timestamp"] >= self.start_date]
+        tx_type_groups = dict(list(df.groupby(df["tx_type"].str.lower(), sort=False)))
+
+        partitions = {}
+        for tx_type, tx_type_class in TX_TYPE_CLASSES.items():
+            partitions[tx_type] = (
+                self._create_tx_class_instance_list(tx_type_class, tx_type_groups[tx_type])
+                if tx_type in tx_type_groups
+                else []
+            )
+        return partitions
+
+    def _get_partitions(self) -> Dict[str, List[Union[Buy, Sell, Trade, Transact]]]:
+        if self._partitions is None:
+            self._partitions = self._partition_df(self.data)
+        return self._partitions
+
+    def iter_partitions(self) -> Iterator[Dict[str, List[Union[Buy, Sell, Trade, Transact]]]]:
+        # in-memory tables are a single partition, chunked data sources override this to stream their data
+        yield self._get_partitions()
+
+    def _iter_raw_df_partitions(
+            self, raw_dfs: Iterable[DataFrame]) -> Iterator[Dict[str, List[Union[Buy, Sell, Trade, Transact]]]]:
+
+        last_timestamp = None
+        row_count = 0
+        for raw_df in raw_dfs:
+            raw_df = raw_df[raw_df["Tx Type"].notna()]
+            if raw_df.empty:
+                continue
+            # rows are numbered across chunks like an unchunked table, so invalid cells point at the same rows
+            raw_df = raw_df.set_axis(RangeIndex(row_count + 1, row_count + len(raw_df) + 1))
+            row_count += len(raw_df)
+
+            df = self._normalize_raw_df(raw_df)
+            if self.price_store is not None:
+                df = self._fill_prices(df)
+            if last_timestamp is not None and df["tx_timestamp"].min() < last_timestamp:
+                raise ValueError("Streamed transactions must be sorted by transaction date, check data!")
+            last_timestamp = df["tx_timestamp"].max()
+
+            yield self._partition_df(df)
+
+    def _get_transactions(self, tx_type: str, tax_year: int, sort_field: str,
                           sort_direction: str) -> List[Union[Buy, Sell, Trade, Transact]]:
 
+        txs = self._get_partitions()[tx_type]
         if tax_year:
-            df = self.data[
-                (self.data["tx_type"].str.lower() == tx_type)
-                # & (to_datetime(self.data["tx_timestamp"], format="%m/%d/%Y") > f"{tax_year}-01-01 00:00:00")
-                & (to_datetime(self.data["tx_timestamp"], format="%m/%d/%Y") < f"{tax_year + 1}-01-01 00:00:00")
-                ]
-        else:
-            df = self.data[self.data["tx_type"].str.lower() == tx_type]
+            tax_year_end = datetime(tax_year + 1, 1, 1)
+            txs = [tx for tx in txs if tx.timestamp < tax_year_end]
 
         return (
             sorted(
-                self._create_tx_class_instance_list(tx_type_class, df),
+                txs,
                 key=lambda x: getattr(x, sort_field),
                 reverse=True if sort_direction == "descending" else False
             )
             if sort_field
-            else self._create_tx_class_instance_list(tx_type_class, df)
+            else list(txs)
         )
 
     def get_buys(self, tax_year: int, sort_field: str, sort_direction: str) -> List[Buy]:
         return self._get_transactions(
-            TxType.BUY.value, Buy, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
+            TxType.BUY.value, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
         )
 
     def get_sells(self, tax_year: int, sort_field: str, sort_direction: str) -> List[Sell]:
         return self._get_transactions(
-            TxType.SELL.value, Sell, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
+            TxType.SELL.value, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
         )
 
     def get_trades(self, tax_year: int, sort_field: str, sort_direction: str) -> List[Trade]:
         return self._get_transactions(
-            TxType.TRADE.value, Trade, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
+            TxType.TRADE.value, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
         )
 
     def get_transacts(self, tax_year: int, sort_field: str, sort_direction: str) -> List[Transact]:
         return self._get_transactions(
-            TxType.TRANSACT.value, Transact, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
+            TxType.TRANSACT.value, tax_year=tax_year, sort_field=sort_field, sort_direction=sort_direction
+        )
+
+    @staticmethod
+    def get_buy_component_of_trade(trade: Trade, fiat_currency: str) -> Buy:
+        return Buy(
+            tx_id=trade.tx_id,
+            timestamp=trade.timestamp,
+            fiat_value=trade.fiat_value,
+            fiat_tx_fee=trade.fiat_tx_fee,
+            currency_in=fiat_currency,
+            currency_in_volume=trade.fiat_value,
+            currency_in_fiat_price=1,
+            currency_out=trade.currency_out,
+            currency_out_volume=trade.currency_out_volume,
+            currency_out_fiat_price=trade.currency_out_fiat_price,
+            taxable=False,
+            description=f"Buy component of trade: {trade}"
+        )
+
+    @staticmethod
+    def get_sell_component_of_trade(trade: Trade, fiat_currency: str) -> Sell:
+        return Sell(
+            tx_id=trade.tx_id,
+            timestamp=trade.timestamp,
+            fiat_value=trade.fiat_value,
+            fiat_tx_fee=trade.fiat_tx_fee,
+            currency_in=trade.currency_in,
+            currency_in_volume=trade.currency_in_volume,
+            currency_in_fiat_price=trade.currency_in_fiat_price,
+            currency_out=fiat_currency,
+            currency_out_volume=trade.fiat_value,
+            currency_out_fiat_price=1,
+            taxable=True,
+            description=f"Sell component of trade: {trade}"
         )
 
     def get_buys_from_trades(self, tax_year: int, fiat_currency: str, sort_field: str,
                              sort_direction: str) -> List[Buy]:
 
         trades = self.get_trades(tax_year, sort_field, sort_direction)
-
-        buy_components_of_trades = []
-        for trade in trades:  # type: Trade
-            buy_components_of_trades.append(
-                Buy(
-                    tx_id=trade.tx_id,
-                    timestamp=trade.timestamp,
-                    fiat_value=trade.fiat_value,
-                    fiat_tx_fee=trade.fiat_tx_fee,
-                    currency_in=fiat_currency,
-                    currency_in_volume=trade.fiat_value,
-                    currency_in_fiat_price=1,
-                    currency_out=trade.currency_out,
-                    currency_out_volume=trade.currency_out_volume,
-                    currency_out_fiat_price=trade.currency_out_fiat_price,
-                    taxable=False,
-                    description=f"Buy component of trade: {trade}"
-                )
-            )
-        return buy_components_of_trades
+        return [self.get_buy_component_of_trade(trade, fiat_currency) for trade in trades]
 
     def get_sells_from_trades(self, tax_year: int, fiat_currency: str, sort_field: str,
                               sort_direction: str) -> List[Sell]:
 
         trades = self.get_trades(tax_year, sort_field, sort_direction)
-
-        sell_components_of_trades = []
-        for trade in trades:  # type: Trade
-            sell_components_of_trades.append(
-                Sell(
-                    tx_id=trade.tx_id,
-                    timestamp=trade.timestamp,
-                    fiat_value=trade.fiat_value,
-                    fiat_tx_fee=trade.fiat_tx_fee,
-                    currency_in=trade.currency_in,
-                    currency_in_volume=trade.currency_in_volume,
-                    currency_in_fiat_price=trade.currency_in_fiat_price,
-                    currency_out=fiat_currency,
-                    currency_out_volume=trade.fiat_value,
-                    currency_out_fiat_price=1,
-                    taxable=True,
-                    description=f"Sell component of trade: {trade}"
-                )
-            )
-        return sell_components_of_trades
+        return [self.get_sell_component_of_trade(trade, fiat_currency) for trade in trades]
 
     def get_buy_events(self, tax_year: int, fiat_currency: str, sort_field: str, sort_direction: str) -> List[Buy]:
         return (
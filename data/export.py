@@ -0,0 +1,93 @@
+import gzip
+import io
+from pathlib import Path
+from typing import IO, Union
+
+from pandas import DataFrame
+
+EXPORT_FORMATS = ["csv", "jsonl", "parquet"]
+COMPRESSIONS = ["gzip", "zstd"]
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def get_export_file_name(file_stem: str, file_format: str = "csv", compression: str = None) -> str:
+    # parquet compresses its column chunks itself, so the file is not wrapped and keeps its extension
+    if file_format == "parquet" or not compression:
+        return f"{file_stem}.{file_format}"
+    return f"{file_stem}.{file_format}{COMPRESSION_EXTENSIONS[compression]}"
+
+
+def open_text_file(file_path: Union[str, Path], compression: str = None) -> IO[str]:
+    if compression == "gzip":
+        return gzip.open(file_path, "wt", encoding="utf-8", newline="")
+    if compression == "zstd":
+        # zstandard is optional, it is only needed to write zstd compressed CSV or JSON lines
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the zstandard package, use gzip or install it!") from None
+        return io.TextIOWrapper(
+            zstandard.ZstdCompressor().stream_writer(open(file_path, "wb")), encoding="utf-8", newline=""
+        )
+    return open(file_path, "w", encoding="utf-8", newline="")
+
+
+class ReportWriter(object):
+
+    def __init__(self, file_path: Union[str, Path], file_format: str = "csv", compression: str = None):
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {file_format}, options are: {', '.join(EXPORT_FORMATS)}")
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}, options are: {', '.join(COMPRESSIONS)}")
+
+        self.file_path = file_path
+        self.file_format = file_format
+        self.compression = compression
+        self.row_count = 0
+        self._parquet_writer = None
+        self._header_written = False
+        self._file = None  # type: Union[IO[str], None]
+        # text files are opened up front, so that a missing compression package fails before matching starts
+        if file_format != "parquet":
+            self._file = open_text_file(file_path, compression)
+
+    def write(self, report_df: DataFrame):
+
+        # the report is written one batch at a time, each batch carries its own index, e.g. the tx_count
+        if self.file_format == "parquet":
+            import pyarrow as pa
+            from pyarrow.parquet import ParquetWriter
+
+            # every batch becomes a row group with the schema of the first one
+            table = pa.Table.from_pandas(
+                report_df.reset_index(),
+                schema=self._parquet_writer.schema if self._parquet_writer else None,
+                preserve_index=False
+            )
+            if self._parquet_writer is None:
+                self._parquet_writer = ParquetWriter(
+                    str(self.file_path), table.schema, compression=self.compression if self.compression else "snappy"
+                )
+            self._parquet_writer.write_table(table)
+
+        elif self.file_format == "csv":
+            report_df.to_csv(self._file, header=not self._header_written)
+            self._header_written = True
+
+        elif len(report_df):
+            json_lines = report_df.reset_index().to_json(orient="records", lines=True, date_format="iso")
+            self._file.write(json_lines if json_lines.endswith("\n") else json_lines + "\n")
+
+        self.row_count += len(report_df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,34 +1,87 @@
 import os
+import re
+from datetime import datetime
 from importlib import import_module
 from itertools import chain
 from pathlib import Path
-from typing import Set
-
-from dotenv import load_dotenv
+from typing import Dict, Iterator, List, Set, Tuple, Union
 
 from data.dao.table import BaseTable
+from models.transactions import Buy, Sell, Trade, Transact
+
+ENV_FILE_PATH = Path(__file__).parent.parent / ".env"
+DEFAULT_SHEET_ID = "10Fco8GhmN1LbGb9RfDCGTosEsZGGp3Yb9mkOW39al0k"
+# <sheet id>:<tab name>!<range>, sheet ids are letters, digits, "-" and "_"
+SHEET_RANGE_PATTERN = re.compile(r"^([A-Za-z0-9_-]+):([^!]+!.*)$")
 
-load_dotenv(Path(__file__).parent.parent / ".env")
 
-DATA_SOURCE = os.getenv("DATA_SOURCE")
+def parse_sheet_ranges(sheet_ranges: str, default_sheet_id: str) -> List[Tuple[str, str]]:
+    # semicolon separated ranges, each optionally prefixed by its sheet id, e.g. "Coinbase!A:Y;<sheet id>:Kraken!A:Y"
+    parsed = []
+    for sheet_range in filter(None, (sheet_range.strip() for sheet_range in sheet_ranges.split(";"))):
+        # a prefix is only a sheet id when a tab name follows it, "A:Y" or "A1:Y500" are ranges of the default sheet
+        match = SHEET_RANGE_PATTERN.match(sheet_range)
+        if match:
+            parsed.append((match.group(1), match.group(2)))
+        else:
+            parsed.append((default_sheet_id, sheet_range))
+    return parsed
 
 
 # noinspection PyPep8Naming
 class TxData(object):
 
-    def __init__(self, fiat_currency: str):
-        DataTable = getattr(import_module(f"data.dao.{DATA_SOURCE.lower()}"), f"{DATA_SOURCE.capitalize()}Table")
-        self.data = DataTable(
-            fiat_currency,
-            "10Fco8GhmN1LbGb9RfDCGTosEsZGGp3Yb9mkOW39al0k",
-            "transactions",
-            "A",
-            "Y"
-        )  # type: BaseTable
+    def __init__(self, fiat_currency: str, offline: bool = False, chunk_size: int = None,
+                 start_date: datetime = None, table: BaseTable = None, data_source: str = None,
+                 file_path: str = None, sheet_id: str = None, sheet_ranges: str = None, price_store=None):
+        if table is not None:
+            # an already loaded table, e.g. a MemoryTable of a synthetic ledger
+            self.data = table
+        else:
+            # the .env file and the data source's dependencies are only loaded once data is needed, not on import,
+            # explicit arguments take precedence over the environment, e.g. for one of many portfolios in a batch
+            from dotenv import load_dotenv
+            load_dotenv(ENV_FILE_PATH)
+
+            data_source = data_source if data_source else os.getenv("DATA_SOURCE")
+            if data_source.lower() == "sheets":
+                DataTable = getattr(import_module("data.dao.sheets"), "SheetsTable")
+                sheet_id = sheet_id if sheet_id else os.getenv("SHEET_ID", DEFAULT_SHEET_ID)
+                sheet_ranges = sheet_ranges if sheet_ranges is not None else os.getenv("SHEET_RANGES", "")
+                self.data = DataTable(
+                    fiat_currency,
+                    sheet_id,
+                    os.getenv("SHEET_TAB", "transactions"),
+                    os.getenv("SHEET_STARTING_RANGE_COL", "A"),
+                    os.getenv("SHEET_ENDING_RANGE_COL", "Y"),
+                    offline=offline,
+                    sheet_ranges=parse_sheet_ranges(sheet_ranges, sheet_id),
+                    workers=int(os.getenv("SHEET_WORKERS", "1"))
+                )  # type: BaseTable
+            else:
+                DataTable = getattr(
+                    import_module(f"data.dao.{data_source.lower()}"), f"{data_source.capitalize()}Table"
+                )
+                # file data sources are local, so they have no offline mode
+                self.data = DataTable(
+                    fiat_currency, file_path if file_path else os.getenv("DATA_FILE_PATH"), chunk_size=chunk_size
+                )  # type: BaseTable
+        self.data.start_date = start_date
+        if price_store is not None:
+            self.data.fill_prices(price_store)
+
+    def get_source_version(self) -> Union[str, None]:
+        return self.data.get_source_version()
+
+    def get_source_id(self) -> Union[str, None]:
+        return self.data.get_source_id()
 
     def get_cryptocurrencies(self) -> Set[str]:
         return self.data.cryptocurrencies
 
+    def iter_partitions(self) -> Iterator[Dict[str, List[Union[Buy, Sell, Trade, Transact]]]]:
+        return self.data.iter_partitions()
+
     def retrieve_buy_events(self, tax_year: int, fiat_currency: str, sort_field: str, sort_direction: str):
         return self.data.get_buy_events(
             tax_year=tax_year, fiat_currency=fiat_currency, sort_field=sort_field, sort_direction=sort_direction
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Iterable, Tuple, Union
+
+import numpy as np
+from pandas import read_csv, to_datetime
+
+PRICES_DIR = Path(__file__).parent.parent / "prices"
+PRICES_DB_PATH = PRICES_DIR / "prices.sqlite"
+
+# days since the epoch, so that as-of lookups compare integers
+EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def to_epoch_days(timestamps) -> np.ndarray:
+    return (np.asarray(timestamps, dtype="datetime64[D]") - EPOCH).astype(np.int64)
+
+
+class PriceStore(object):
+
+    def __init__(self, db_path: Union[str, Path] = PRICES_DB_PATH, max_age_days: int = 7, cache_size: int = 4096):
+        db_path = Path(db_path)
+        if not db_path.parent.exists():
+            os.makedirs(db_path.parent)
+        self.db_path = db_path
+        # prices older than this are treated as missing instead of being carried forward indefinitely
+        self.max_age_days = max_age_days
+        self._lock = Lock()
+        self._connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        # the primary key is a b-tree on (fiat, ticker, day), so every as-of lookup is a single O(log n) seek
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS prices ("
+            "fiat_currency TEXT NOT NULL, ticker TEXT NOT NULL, day INTEGER NOT NULL, price REAL NOT NULL, "
+            "PRIMARY KEY (fiat_currency, ticker, day)) WITHOUT ROWID"
+        )
+        self.get_price = lru_cache(maxsize=cache_size)(self._get_price)
+        self._get_series = lru_cache(maxsize=cache_size)(self._load_series)
+
+    def close(self):
+        self._connection.close()
+
+    def _clear_caches(self):
+        self.get_price.cache_clear()
+        self._get_series.cache_clear()
+
+    def load_csv(self, file_path: Union[str, Path], fiat_currency: str = "usd", ticker: str = None,
+                 date_col: str = "date", ticker_col: str = "ticker", price_col: str = "price") -> int:
+
+        # e.g. a daily price dump with date, ticker and price columns, or one file per ticker without a ticker column
+        prices_df = read_csv(file_path, usecols=[date_col, price_col] + ([] if ticker else [ticker_col]))
+        prices_df = prices_df[prices_df[price_col].notna() & (prices_df[price_col] > 0)]
+        tickers = (
+            np.full(len(prices_df), ticker.upper(), dtype=object)
+            if ticker
+            else prices_df[ticker_col].astype(str).str.upper().values
+        )
+        return self.load_prices(zip(
+            tickers,
+            to_epoch_days(to_datetime(prices_df[date_col]).dt.tz_localize(None).values).tolist(),
+            prices_df[price_col].astype(float).tolist()
+        ), fiat_currency)
+
+    def load_prices(self, prices: Iterable[Tuple[str, int, float]], fiat_currency: str = "usd") -> int:
+
+        fiat_currency = fiat_currency.upper()
+        with self._lock, self._connection:
+            cursor = self._connection.executemany(
+                "INSERT OR REPLACE INTO prices (fiat_currency, ticker, day, price) VALUES (?, ?, ?, ?)",
+                ((fiat_currency, ticker, day, price) for ticker, day, price in prices)
+            )
+            self._clear_caches()
+        return cursor.rowcount
+
+    def _get_price(self, ticker: str, date: datetime, fiat_currency: str = "usd") -> Union[float, None]:
+
+        day = int(to_epoch_days([date])[0])
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT day, price FROM prices WHERE fiat_currency = ? AND ticker = ? AND day <= ? "
+                "ORDER BY day DESC LIMIT 1",
+                (fiat_currency.upper(), ticker.upper(), day)
+            ).fetchone()
+        if row is None or (self.max_age_days is not None and day - row[0] > self.max_age_days):
+            return None
+        return row[1]
+
+    def _load_series(self, ticker: str, fiat_currency: str) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT day, price FROM prices WHERE fiat_currency = ? AND ticker = ? ORDER BY day",
+                (fiat_currency, ticker)
+            ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64), np.array([row[1] for row in rows], dtype=float)
+
+    def get_prices(self, tickers: Iterable[str], timestamps: Iterable, fiat_currency: str = "usd") -> np.ndarray:
+
+        # bulk as-of lookup, one sorted series per ticker and a binary search per row, NaN where no price is known
+        tickers = np.asarray([str(ticker).upper() for ticker in tickers], dtype=object)
+        days = to_epoch_days(timestamps)
+        prices = np.full(len(tickers), np.nan)
+        for ticker in np.unique(tickers):
+            rows = np.flatnonzero(tickers == ticker)
+            series_days, series_prices = self._get_series(ticker, fiat_currency.upper())
+            if len(series_days) == 0:
+                continue
+            positions = np.searchsorted(series_days, days[rows], side="right") - 1
+            found = positions >= 0
+            if self.max_age_days is not None:
+                found &= days[rows] - series_days[np.maximum(positions, 0)] <= self.max_age_days
+            prices[rows[found]] = series_prices[positions[found]]
+        return prices
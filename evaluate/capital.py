@@ -1,126 +1,364 @@
-from collections import defaultdict
-from copy import deepcopy
-from enum import Enum
-from typing import List, Union
-
-from pandas import concat, to_datetime
-
+import os
+import pickle
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from itertools import chain, count, islice
+from operator import itemgetter
+from tempfile import TemporaryFile
+from typing import Dict, Iterable, Iterator, List, Sequence, Set, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame, Series, to_datetime
+
+from data.dao.table import BaseTable
 from data.extract import TxData
-from models.transactions import Transaction, Buy, Sell, Transact, TaxableTransaction
-
-RD = 8
-
-
-class TxFlow(Enum):
-    IN = "in"
-    OUT = "out"
-
-
-# noinspection DuplicatedCode
-def split_unequal_tx(smaller_volume_tx: Transaction, greater_volume_tx: Transaction, greater_volume_tx_flow: TxFlow):
-    opposite_flow = None  # type: Union[None, TxFlow]
-    for flow in TxFlow:
-        if flow.value != greater_volume_tx_flow.value:
-            opposite_flow = flow
-
-    greater_volume_tx_processed_pct = (
-            getattr(smaller_volume_tx, f"currency_{greater_volume_tx_flow.value}_volume")
-            / getattr(greater_volume_tx, f"currency_{opposite_flow.value}_volume")
-    )
-
-    greater_volume_tx_processed_split = deepcopy(greater_volume_tx)
-    greater_volume_tx_processed_split.currency_in_volume = (
-        round(float(greater_volume_tx_processed_split.currency_in_volume * greater_volume_tx_processed_pct), RD)
-    )
-    greater_volume_tx_processed_split.currency_out_volume = (
-        round(float(greater_volume_tx_processed_split.currency_out_volume * greater_volume_tx_processed_pct), RD)
-    )
-    greater_volume_tx_processed_split.fiat_value = (
-        round(float(greater_volume_tx_processed_split.fiat_value * greater_volume_tx_processed_pct), RD)
-    )
-    greater_volume_tx_processed_split.fiat_tx_fee = (
-        round(float(greater_volume_tx_processed_split.fiat_tx_fee * greater_volume_tx_processed_pct), RD)
-    )
-
-    greater_volume_tx_unprocessed_pct = 1 - greater_volume_tx_processed_pct
-
-    greater_volume_tx_unprocessed_split = deepcopy(greater_volume_tx)
-    greater_volume_tx_unprocessed_split.currency_in_volume = (
-        round(float(greater_volume_tx_unprocessed_split.currency_in_volume * greater_volume_tx_unprocessed_pct), RD)
-    )
-    greater_volume_tx_unprocessed_split.currency_out_volume = (
-        round(float(greater_volume_tx_unprocessed_split.currency_out_volume * greater_volume_tx_unprocessed_pct), RD)
-    )
-    greater_volume_tx_unprocessed_split.fiat_value = (
-        round(float(greater_volume_tx_unprocessed_split.fiat_value * greater_volume_tx_unprocessed_pct), RD)
-    )
-    greater_volume_tx_unprocessed_split.fiat_tx_fee = (
-        round(float(greater_volume_tx_unprocessed_split.fiat_tx_fee * greater_volume_tx_unprocessed_pct), RD)
-    )
-
-    return greater_volume_tx_processed_split, greater_volume_tx_unprocessed_split
+from evaluate.kernel import (
+    KERNELS, get_short_term, get_taxable_columns, match_lot_arrays, pack_lot_arrays, to_dates
+)
+from evaluate.lots import (
+    COST_BASIS_METHODS, LotMatcher, TxFlow, match_lots, match_packed_lots, pack_lots, unpack_lot
+)
+from evaluate.state import load_open_lots, save_open_lots
+from evaluate.wash_sale import WASH_SALE_DAYS, AcquisitionIndex
+from models.attributes import TxType
+from models.transactions import Transaction, Buy, Sell, Trade, Transact, TaxableTransaction
+from utils.profiler import profile_stage, stage
+
+# output columns in order, nullable dtypes keep the None values of taxable income rows
+COLUMN_DTYPES = OrderedDict([
+    ("cryptocurrency", "object"),
+    ("lot_description", "object"),
+    ("date_acquired", "datetime64[ns]"),
+    ("date_acquired_str", "object"),
+    ("date_sold", "datetime64[ns]"),
+    ("date_sold_str", "object"),
+    ("sales_proceeds", "Int64"),
+    ("cost_basis", "Int64"),
+    ("capital_gain_or_loss", "Int64"),
+    ("short_term", "boolean"),
+    ("long_term", "boolean"),
+    ("wash_sale", "boolean"),
+    ("disallowed_loss", "Int64")
+])
 
 
 class TaxableCrypto(object):
 
     def __init__(self, tax_year: int = None, fiat_currency: str = "usd", sort_field: str = "timestamp",
-                 sort_direction: str = "ascending", expenditure_types: List[str] = None):
+                 sort_direction: str = "ascending", expenditure_types: List[str] = None, offline: bool = False,
+                 chunk_size: int = None, workers: int = 1, save_state: bool = False, resume: bool = False,
+                 cost_basis_method: str = "fifo", tx_data: TxData = None, price_store=None, kernel: str = "object",
+                 wash_sales: bool = False):
+        if (save_state or resume) and not tax_year:
+            raise ValueError("A tax year is required to save or resume from open lots!")
+        if cost_basis_method not in COST_BASIS_METHODS.keys():
+            raise ValueError(
+                f"Unknown cost basis method {cost_basis_method}, options are: {', '.join(COST_BASIS_METHODS.keys())}"
+            )
+        if kernel not in KERNELS:
+            raise ValueError(f"Unknown kernel {kernel}, options are: {', '.join(KERNELS)}")
+        # the columnar kernel intersects cumulative volumes, which only describes FIFO over the whole ledger
+        if kernel == "numpy" and (cost_basis_method != "fifo" or chunk_size or save_state):
+            raise ValueError("The numpy kernel only supports fifo without chunk size or saving open lots!")
+
         self.tax_year = tax_year
         self.fiat_currency = fiat_currency
         self.sort_field = sort_field
         self.sort_direction = sort_direction
         self.expenditure_types = expenditure_types if expenditure_types else ["purchase", "donation", "gift"]
+        self.offline = offline
+        self.chunk_size = chunk_size
+        self.workers = workers if workers and workers > 0 else os.cpu_count()
+        self.save_state = save_state
+        self.resume = resume
+        self.cost_basis_method = cost_basis_method
+        self.tx_data = tx_data  # type: Union[TxData, None]
+        self.price_store = price_store
+        self.kernel = kernel
+        # acquisitions are only indexed when the capital losses are checked for wash sales
+        self.acquisition_index = AcquisitionIndex() if wash_sales else None  # type: Union[AcquisitionIndex, None]
         self.capital_gains_and_losses = []
         self.taxable_income = defaultdict(list)
 
     @staticmethod
-    def _get_df_from_tx_list(taxable_txs: List[TaxableTransaction], exclude_columns: List[str] = None):
-
-        taxable_txs_df = concat(
-            [taxable_tx.to_pd_series() for taxable_tx in taxable_txs],
-            axis=1
-        ).T
-
-        taxable_txs_df["cryptocurrency"] = taxable_txs_df["cryptocurrency"].str.upper()
+    def _get_df_from_columns(columns: Dict[str, Sequence], exclude_columns: List[str] = None):
+
+        exclude_columns = exclude_columns if exclude_columns else []
+        # optional columns, e.g. of the wash sale analysis, are only included when they were computed
+        column_order = [col for col in COLUMN_DTYPES.keys() if col in columns and col not in exclude_columns]
+
+        # the frame is built column by column with explicit dtypes instead of concatenating one Series per row
+        taxable_txs_df = DataFrame({
+            col: (
+                to_datetime(columns[col])
+                if COLUMN_DTYPES[col] == "datetime64[ns]"
+                else Series(columns[col], dtype=COLUMN_DTYPES[col])
+            )
+            for col in column_order
+        })
+
+        if "cryptocurrency" in taxable_txs_df.columns:
+            taxable_txs_df["cryptocurrency"] = taxable_txs_df["cryptocurrency"].str.upper()
         taxable_txs_df.index += 1
         taxable_txs_df.index.name = "tx_count"
 
-        column_order = [
-            "cryptocurrency",
-            "lot_description",
-            "date_acquired",
-            "date_acquired_str",
-            "date_sold",
-            "date_sold_str",
-            "sales_proceeds",
-            "cost_basis",
-            "capital_gain_or_loss",
-            "short_term",
-            "long_term"
-        ]
-        column_order = [col for col in column_order if col not in exclude_columns]
+        return taxable_txs_df
 
-        taxable_txs_df = taxable_txs_df[column_order]
+    @staticmethod
+    def _get_pairs_from_tx_list(taxable_txs: List[TaxableTransaction]) -> Dict[str, np.ndarray]:
+        # the fields the frame columns are derived from, as arrays with NaN where TaxableTransaction has None
+        return {
+            "cryptocurrency": np.array([taxable_tx.cryptocurrency for taxable_tx in taxable_txs], dtype=object),
+            "volume": np.array([taxable_tx.lot_volume for taxable_tx in taxable_txs], dtype=float),
+            "date_acquired": to_dates([taxable_tx.date_acquired for taxable_tx in taxable_txs]),
+            "date_sold": to_dates([taxable_tx.date_sold for taxable_tx in taxable_txs]),
+            **{
+                col: np.array([getattr(taxable_tx, col) for taxable_tx in taxable_txs], dtype=float)
+                for col in ["sales_proceeds", "cost_basis", "capital_gain_or_loss"]
+            }
+        }
 
-        return taxable_txs_df
+    @staticmethod
+    def _get_df_from_pairs(pairs: Dict[str, np.ndarray], exclude_columns: List[str] = None,
+                           acquisition_index: AcquisitionIndex = None):
 
-    # noinspection DuplicatedCode
-    def get_capital_gains_and_losses(self):
+        # the term flags and strings are derived for the whole batch at once instead of per TaxableTransaction
+        columns = get_taxable_columns(
+            pairs["cryptocurrency"], pairs["volume"].tolist(), pairs["date_acquired"], pairs["date_sold"]
+        )
+        if acquisition_index is not None:
+            columns.update(acquisition_index.get_wash_sales(
+                pairs["cryptocurrency"], pairs["date_acquired"], pairs["date_sold"], pairs["volume"],
+                pairs["capital_gain_or_loss"]
+            ))
+        columns.update({
+            col: pairs[col]
+            for col in [
+                "cryptocurrency", "date_acquired", "date_sold", "sales_proceeds", "cost_basis", "capital_gain_or_loss"
+            ]
+        })
+        return TaxableCrypto._get_df_from_columns(columns, exclude_columns)
+
+    @staticmethod
+    @profile_stage("dataframe", rows=lambda taxable_txs, *args, **kwargs: len(taxable_txs))
+    def _get_df_from_tx_list(taxable_txs: List[TaxableTransaction], exclude_columns: List[str] = None,
+                             acquisition_index: AcquisitionIndex = None):
+        return TaxableCrypto._get_df_from_pairs(
+            TaxableCrypto._get_pairs_from_tx_list(taxable_txs), exclude_columns, acquisition_index
+        )
+
+    @staticmethod
+    def _sort_capital_gains_and_losses(taxable_txs: Iterable[TaxableTransaction]) -> List[TaxableTransaction]:
+        # short term before long term, then by date sold, with the holding periods of all pairs compared at once
+        taxable_txs = list(taxable_txs)
+        date_sold = to_dates([taxable_tx.date_sold for taxable_tx in taxable_txs])
+        short_term = get_short_term(to_dates([taxable_tx.date_acquired for taxable_tx in taxable_txs]), date_sold)
+        return [taxable_txs[i] for i in np.lexsort((date_sold, short_term))]
+
+    def _get_tx_data(self) -> TxData:
+        if self.tx_data is None:
+            self.tx_data = TxData(
+                self.fiat_currency,
+                offline=self.offline,
+                chunk_size=self.chunk_size,
+                # when resuming, earlier transactions are already accounted for by the prior year's open lots
+                start_date=datetime(self.tax_year, 1, 1) if self.resume else None,
+                price_store=self.price_store
+            )
+        return self.tx_data
+
+    def _get_prior_open_lots(self) -> Dict[str, List[Transaction]]:
+        if not self.resume:
+            return {}
+        return load_open_lots(
+            self.fiat_currency, self.tax_year - 1, self.cost_basis_method, self._get_tx_data().get_source_id()
+        )
+
+    def _get_partition_events(self, partition: Dict[str, List[Transaction]], first_event_count: int,
+                              prior_tickers: Set[str]) -> List[tuple]:
+
+        # events are (timestamp, flow rank, tx type rank, event count, ticker, tx), so that sorting them puts lots
+        # before sales of the same day in the same order as get_capital_gains_and_losses
+        tallied_tickers = {
+            ticker for ticker in self._get_tx_data().get_cryptocurrencies() | prior_tickers
+            if ticker not in self.expenditure_types
+        }
+        fiat_currency = self.fiat_currency.upper()
+
+        event_counter = count(first_event_count)
+        events = []
+        for tx in partition[TxType.BUY.value]:  # type: Buy
+            events.append((tx.timestamp, 0, 0, next(event_counter), tx.currency_out.lower(), tx))
+        for tx in partition[TxType.TRADE.value]:  # type: Trade
+            buy = BaseTable.get_buy_component_of_trade(tx, fiat_currency)
+            events.append((tx.timestamp, 0, 1, next(event_counter), buy.currency_out.lower(), buy))
+        for tx in partition[TxType.SELL.value]:  # type: Sell
+            events.append((tx.timestamp, 1, 0, next(event_counter), tx.currency_in.lower(), tx))
+        for tx in partition[TxType.TRADE.value]:  # type: Trade
+            sell = BaseTable.get_sell_component_of_trade(tx, fiat_currency)
+            events.append((tx.timestamp, 1, 1, next(event_counter), sell.currency_in.lower(), sell))
+        for tx in partition[TxType.TRANSACT.value]:  # type: Transact
+            ticker_to = tx.currency_out.lower()
+            ticker_from = tx.currency_in.lower()
+            if ticker_to in tallied_tickers:
+                events.append((tx.timestamp, 0, 2, next(event_counter), ticker_to, tx))
+            elif ticker_from in tallied_tickers:
+                events.append((tx.timestamp, 1, 2, next(event_counter), ticker_from, tx))
+
+        return events
+
+    def iter_capital_gains_and_losses(self) -> Iterator[TaxableTransaction]:
+
+        tx_data = self._get_tx_data()
+        tax_year_end = datetime(self.tax_year + 1, 1, 1) if self.tax_year else None
+        wash_sale_end = tax_year_end + timedelta(days=WASH_SALE_DAYS + 1) if self.tax_year else None
+        lot_matcher_class = COST_BASIS_METHODS[self.cost_basis_method]
+        lot_matchers = defaultdict(lot_matcher_class)  # type: Dict[str, LotMatcher]
+        for ticker, lots in self._get_prior_open_lots().items():
+            lot_matchers[ticker] = lot_matcher_class(lots)
+            if self.acquisition_index is not None:
+                self.acquisition_index.add_lots(ticker, lots)
+        prior_tickers = set(lot_matchers.keys())
+
+        pending_events = []
+        event_count = 0
+        partitions = tx_data.iter_partitions()
+        tax_year_ended = False
+        for partition in chain(partitions, [None]):
+
+            if tax_year_ended:
+                break
+
+            if partition is None:
+                events = pending_events
+                pending_events = []
+            else:
+                partition_events = self._get_partition_events(partition, event_count, prior_tickers)
+                event_count += len(partition_events)
+                events = pending_events + partition_events
+                events.sort(key=itemgetter(0, 1, 2, 3))
+                # the last day of a chunk can continue in the next one, so it is held back until then
+                last_timestamp = events[-1][0] if events else None
+                pending_events = [event for event in events if event[0] == last_timestamp]
+                events = [event for event in events if event[0] != last_timestamp]
+
+            for timestamp, flow_rank, tx_type_rank, _, ticker, tx in events:
+
+                if tax_year_end and timestamp >= tax_year_end:
+                    # repurchases shortly after the tax year can still disallow losses of its last days
+                    if self.acquisition_index is not None and timestamp < wash_sale_end:
+                        if flow_rank == 0:
+                            self.acquisition_index.add(ticker, tx.timestamp, tx.currency_out_volume)
+                        continue
+                    tax_year_ended = True
+                    break
+
+                if flow_rank == 0:
+                    lot_matchers[ticker].add_lot(tx)
+                    if self.acquisition_index is not None:
+                        self.acquisition_index.add(ticker, tx.timestamp, tx.currency_out_volume)
+                    if tx_type_rank == 2:
+                        self.taxable_income[ticker].append(tx)
+                    continue
+
+                for tx_in, tx_out in lot_matchers[ticker].match(tx):
+                    if self.acquisition_index is not None:
+                        self.acquisition_index.add_sale(
+                            ticker, tx_in.timestamp, tx_out.timestamp, tx_in.currency_out_volume
+                        )
+                    if not self.tax_year or tx_out.timestamp.year == self.tax_year:
+                        taxable_tx = TaxableTransaction(ticker, tx_in, tx_out)
+                        if taxable_tx.capital_gain_or_loss != 0:
+                            yield taxable_tx
+
+        if self.save_state:
+            save_open_lots(
+                {ticker: lot_matcher.get_open_lots() for ticker, lot_matcher in lot_matchers.items()},
+                self.fiat_currency,
+                self.tax_year,
+                self.cost_basis_method,
+                self._get_tx_data().get_source_id()
+            )
+
+    def _match_crypto_tallies(self, crypto_tallies: Dict[str, Dict[str, List[Transaction]]]
+                              ) -> Iterator[Tuple[str, Transaction, Transaction]]:
+
+        tickers = [ticker for ticker, tallies in crypto_tallies.items() if len(tallies["out"]) > 0]
+
+        # open lots are only tracked in process, so saving them always matches serially
+        if self.workers == 1 or len(tickers) < 2 or self.save_state:
+            open_lots = {}
+            for ticker, tallies in crypto_tallies.items():
+                lot_matcher = COST_BASIS_METHODS[self.cost_basis_method]()
+                for tx_in, tx_out in match_lots(tallies["in"], tallies["out"], lot_matcher):
+                    yield ticker, tx_in, tx_out
+                open_lots[ticker] = lot_matcher.get_open_lots()
+
+            if self.save_state:
+                save_open_lots(
+                    open_lots, self.fiat_currency, self.tax_year, self.cost_basis_method,
+                    self._get_tx_data().get_source_id()
+                )
+            return
+
+        # multiprocessing is only imported when lots are matched in parallel
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tickers))) as executor:
+            # the largest tickers are submitted first, results are still merged in ticker order
+            futures = {
+                ticker: executor.submit(
+                    match_packed_lots,
+                    pack_lots(crypto_tallies[ticker]["in"]),
+                    pack_lots(crypto_tallies[ticker]["out"]),
+                    self.cost_basis_method
+                )
+                for ticker in sorted(tickers, key=lambda x: len(crypto_tallies[x]["out"]), reverse=True)
+            }
+            for ticker in tickers:
+                txs_in = crypto_tallies[ticker]["in"]
+                txs_out = crypto_tallies[ticker]["out"]
+                for packed_match in futures[ticker].result():
+                    yield (
+                        ticker,
+                        unpack_lot(txs_in[packed_match[0]], packed_match[1:5]),
+                        unpack_lot(txs_out[packed_match[5]], packed_match[6:10])
+                    )
 
-        tx_data = TxData(self.fiat_currency)
-        buys = tx_data.retrieve_buy_events(self.tax_year, self.fiat_currency, self.sort_field, self.sort_direction)
-        sells = tx_data.retrieve_sell_events(self.tax_year, self.fiat_currency, self.sort_field, self.sort_direction)
-        transacts = tx_data.retrieve_transact_events(self.tax_year, self.sort_field, self.sort_direction)
+    def _get_crypto_tallies(self) -> Dict[str, Dict[str, List[Transaction]]]:
+
+        tx_data = self._get_tx_data()
+        tax_year_end = datetime(self.tax_year + 1, 1, 1) if self.tax_year else None
+        # repurchases shortly after the tax year can still disallow losses of its last days, so their acquisitions
+        # are retrieved too, they are only indexed and never tallied
+        index_next_year = tax_year_end is not None and self.acquisition_index is not None
+        acquisition_year = self.tax_year + 1 if index_next_year else self.tax_year
+        wash_sale_end = tax_year_end + timedelta(days=WASH_SALE_DAYS + 1) if index_next_year else None
+
+        with stage("extract"):
+            buys = tx_data.retrieve_buy_events(
+                acquisition_year, self.fiat_currency, self.sort_field, self.sort_direction
+            )
+            sells = tx_data.retrieve_sell_events(
+                self.tax_year, self.fiat_currency, self.sort_field, self.sort_direction
+            )
+            transacts = tx_data.retrieve_transact_events(acquisition_year, self.sort_field, self.sort_direction)
+
+        prior_open_lots = self._get_prior_open_lots()
 
         crypto_tallies = {
             ticker: {
                 "in": [],
                 "out": []
-            } for ticker in tx_data.get_cryptocurrencies() if ticker.lower() not in self.expenditure_types
+            } for ticker in chain(tx_data.get_cryptocurrencies(), prior_open_lots.keys())
+            if ticker.lower() not in self.expenditure_types
         }
 
         for tx in buys:  # type: Buy
             ticker = tx.currency_out.lower()
+            if index_next_year and tx.timestamp >= tax_year_end:
+                if tx.timestamp < wash_sale_end:
+                    self.acquisition_index.add(ticker, tx.timestamp, tx.currency_out_volume)
+                continue
             crypto_tallies[ticker]["in"].append(tx)
 
         for tx in sells:  # type: Sell
@@ -130,117 +368,193 @@ class TaxableCrypto(object):
         for tx in transacts:  # type: Transact
             ticker_to = tx.currency_out.lower()
             ticker_from = tx.currency_in.lower()
+            if index_next_year and tx.timestamp >= tax_year_end:
+                if ticker_to in crypto_tallies.keys() and tx.timestamp < wash_sale_end:
+                    self.acquisition_index.add(ticker_to, tx.timestamp, tx.currency_out_volume)
+                continue
             if ticker_to in crypto_tallies.keys():
                 crypto_tallies[ticker_to]["in"].append(tx)
                 self.taxable_income[ticker_to].append(tx)
             elif ticker_from in crypto_tallies.keys():
                 crypto_tallies[ticker_from]["out"].append(tx)
 
-        for tallies in crypto_tallies.values():
-            tallies["in"] = sorted(tallies["in"], key=lambda x: x.timestamp)
-            tallies["out"] = sorted(tallies["out"], key=lambda x: x.timestamp)
-
         for ticker, tallies in crypto_tallies.items():
+            tallies["in"] = prior_open_lots.get(ticker, []) + sorted(tallies["in"], key=lambda x: x.timestamp)
+            tallies["out"] = sorted(tallies["out"], key=lambda x: x.timestamp)
+            if self.acquisition_index is not None:
+                self.acquisition_index.add_lots(ticker, tallies["in"])
 
-            # if ticker != "yldy":
-            #     continue
-            #
-            # print(f"Transactions for {ticker}:")
-            # print()
-
-            txs_in = tallies["in"]  # type: List[Transaction]
-            txs_out = tallies["out"]  # type: List[Transaction]
-
-            if len(txs_out) == 0:
-                continue
-
-            split_txs_in = []
-            split_txs_out = []
-
-            running_total_tx_in_volume = 0
-            running_total_tx_out_volume = 0
-            running_total_ticker_volume = 0
-            while len(txs_out) > 0:
-
-                first_tx_in = txs_in.pop(0)
-                first_tx_out = txs_out.pop(0)
-
-                if first_tx_out.timestamp < first_tx_in.timestamp:
-                    raise IndexError("Currency out transaction detected before currency in transaction, check data!")
-
-                if first_tx_in.currency_out_volume == first_tx_out.currency_in_volume:
-
-                    split_txs_in.append(first_tx_in)
-                    split_txs_out.append(first_tx_out)
-
-                    running_total_tx_in_volume += first_tx_in.currency_out_volume
-                    running_total_tx_out_volume += first_tx_out.currency_in_volume
-                    running_total_ticker_volume += (first_tx_in.currency_out_volume - first_tx_out.currency_in_volume)
-
-                    if self.tax_year:
-                        if first_tx_out.timestamp.year == self.tax_year:
-                            self.capital_gains_and_losses.append(TaxableTransaction(ticker, first_tx_in, first_tx_out))
-                    else:
-                        self.capital_gains_and_losses.append(TaxableTransaction(ticker, first_tx_in, first_tx_out))
-
-                elif first_tx_in.currency_out_volume > first_tx_out.currency_in_volume:
-
-                    first_tx_in_sold_split, first_tx_in_unsold_split = split_unequal_tx(
-                        smaller_volume_tx=first_tx_out, greater_volume_tx=first_tx_in, greater_volume_tx_flow=TxFlow.IN
-                    )
-
-                    split_txs_in.append(first_tx_in_sold_split)
-                    split_txs_out.append(first_tx_out)
-
-                    running_total_tx_in_volume += first_tx_in_sold_split.currency_out_volume
-                    running_total_tx_out_volume += first_tx_out.currency_in_volume
-                    running_total_ticker_volume += (
-                            first_tx_in_sold_split.currency_out_volume - first_tx_out.currency_in_volume
-                    )
-
-                    txs_in.insert(0, first_tx_in_unsold_split)
+        return crypto_tallies
 
-                    if self.tax_year:
-                        if first_tx_out.timestamp.year == self.tax_year:
-                            self.capital_gains_and_losses.append(
-                                TaxableTransaction(ticker, first_tx_in_sold_split, first_tx_out)
-                            )
-                    else:
-                        self.capital_gains_and_losses.append(
-                            TaxableTransaction(ticker, first_tx_in_sold_split, first_tx_out)
-                        )
-
-                elif first_tx_in.currency_out_volume < first_tx_out.currency_in_volume:
+    # noinspection DuplicatedCode
+    def get_capital_gains_and_losses(self):
 
-                    first_tx_out_bought_split, first_tx_out_unbought_split = split_unequal_tx(
-                        smaller_volume_tx=first_tx_in, greater_volume_tx=first_tx_out, greater_volume_tx_flow=TxFlow.OUT
+        if self.chunk_size:
+            # reading, normalizing and extracting the chunks are profiled as their own stages
+            with stage("match") as match_stage:
+                capital_gains_and_losses = self._sort_capital_gains_and_losses(self.iter_capital_gains_and_losses())
+                match_stage.add_rows(len(capital_gains_and_losses))
+            return capital_gains_and_losses
+
+        crypto_tallies = self._get_crypto_tallies()
+
+        with stage("match") as match_stage:
+            for ticker, tx_in, tx_out in self._match_crypto_tallies(crypto_tallies):
+                # every pair is indexed, a lot sold before the tax year is no replacement for a loss in it either
+                if self.acquisition_index is not None:
+                    self.acquisition_index.add_sale(
+                        ticker, tx_in.timestamp, tx_out.timestamp, tx_in.currency_out_volume
                     )
+                if self.tax_year:
+                    if tx_out.timestamp.year == self.tax_year:
+                        self.capital_gains_and_losses.append(TaxableTransaction(ticker, tx_in, tx_out))
+                else:
+                    self.capital_gains_and_losses.append(TaxableTransaction(ticker, tx_in, tx_out))
+            match_stage.add_rows(len(self.capital_gains_and_losses))
+
+        return self._sort_capital_gains_and_losses(
+            taxable_tx for taxable_tx in self.capital_gains_and_losses if taxable_tx.capital_gain_or_loss != 0
+        )
 
-                    split_txs_in.append(first_tx_in)
-                    split_txs_out.append(first_tx_out_bought_split)
-
-                    running_total_tx_in_volume += first_tx_in.currency_out_volume
-                    running_total_tx_out_volume += first_tx_out_bought_split.currency_in_volume
-                    running_total_ticker_volume += (
-                            first_tx_in.currency_out_volume - first_tx_out_bought_split.currency_in_volume
+    def _get_columnar_capital_gains_and_losses_df(self, exclude_columns: List[str] = None):
+
+        crypto_tallies = self._get_crypto_tallies()
+
+        with stage("match") as match_stage:
+            matched = {
+                "cryptocurrency": [np.empty(0, dtype=object)],
+                "volume": [np.empty(0)],
+                "date_acquired": [np.empty(0, dtype="datetime64[ns]")],
+                "date_sold": [np.empty(0, dtype="datetime64[ns]")],
+                "cost_basis": [np.empty(0)],
+                "sales_proceeds": [np.empty(0)]
+            }  # type: Dict[str, List[np.ndarray]]
+            for ticker, tallies in crypto_tallies.items():
+                if len(tallies["out"]) == 0:
+                    continue
+                in_timestamps, in_volumes, in_values = pack_lot_arrays(tallies["in"], TxFlow.IN)
+                out_timestamps, out_volumes, out_values = pack_lot_arrays(tallies["out"], TxFlow.OUT)
+                in_index, out_index, volumes, cost_basis, sales_proceeds = match_lot_arrays(
+                    in_timestamps, in_volumes, in_values, out_timestamps, out_volumes, out_values
+                )
+                if self.acquisition_index is not None:
+                    self.acquisition_index.add_sales(
+                        ticker, in_timestamps[in_index], out_timestamps[out_index], volumes
                     )
+                matched["cryptocurrency"].append(np.full(len(volumes), ticker.upper(), dtype=object))
+                matched["volume"].append(volumes)
+                matched["date_acquired"].append(in_timestamps[in_index])
+                matched["date_sold"].append(out_timestamps[out_index])
+                matched["cost_basis"].append(cost_basis)
+                matched["sales_proceeds"].append(sales_proceeds)
+            pairs = {col: np.concatenate(arrays) for col, arrays in matched.items()}
+
+            if self.tax_year:
+                in_tax_year = pairs["date_sold"].astype("datetime64[Y]").astype(int) + 1970 == self.tax_year
+                pairs = {col: array[in_tax_year] for col, array in pairs.items()}
+
+            # same rounding as TaxableTransaction, a gain is only known when both the proceeds and the cost basis are
+            pairs["sales_proceeds"] = np.round(pairs["sales_proceeds"])
+            pairs["cost_basis"] = np.round(pairs["cost_basis"])
+            pairs["capital_gain_or_loss"] = np.where(
+                (pairs["sales_proceeds"] != 0) & (pairs["cost_basis"] != 0),
+                pairs["sales_proceeds"] - pairs["cost_basis"],
+                np.nan
+            )
+            short_term = get_short_term(pairs["date_acquired"], pairs["date_sold"])
+
+            rows = np.flatnonzero(pairs["capital_gain_or_loss"] != 0)
+            rows = rows[np.lexsort((pairs["date_sold"][rows], short_term[rows]))]
+            match_stage.add_rows(len(rows))
+
+        with stage("dataframe", len(rows)):
+            return self._get_df_from_pairs(
+                {col: array[rows] for col, array in pairs.items()}, exclude_columns, self.acquisition_index
+            )
 
-                    txs_out.insert(0, first_tx_out_unbought_split)
-
-                    if self.tax_year:
-                        if first_tx_out_bought_split.timestamp.year == self.tax_year:
-                            self.capital_gains_and_losses.append(
-                                TaxableTransaction(ticker, first_tx_in, first_tx_out_bought_split)
+    @staticmethod
+    def _iter_day_batches(taxable_txs: Iterator[TaxableTransaction],
+                          batch_size: int) -> Iterator[List[TaxableTransaction]]:
+
+        # pairs come in date sold order, every batch ends with a whole day so that a day is never split across batches
+        pending_txs = []
+        for batch in iter(lambda: list(islice(taxable_txs, batch_size)), []):
+            batch = pending_txs + batch
+            day_end = len(batch)
+            while day_end > 0 and batch[day_end - 1].date_sold == batch[-1].date_sold:
+                day_end -= 1
+            pending_txs = batch[day_end:]
+            if day_end:
+                yield batch[:day_end]
+        if pending_txs:
+            yield pending_txs
+
+    def _get_ticker_ranks(self) -> Dict[str, int]:
+        # the order _get_crypto_tallies puts the tickers in
+        tickers = chain(self._get_tx_data().get_cryptocurrencies(), self._get_prior_open_lots().keys())
+        return {ticker: rank for rank, ticker in enumerate(dict.fromkeys(tickers))}
+
+    def iter_capital_gains_and_losses_dfs(self, exclude_columns: List[str] = None,
+                                          batch_size: int = 100_000) -> Iterator[DataFrame]:
+
+        if self.kernel == "numpy":
+            yield self.get_capital_gains_and_losses_df(exclude_columns)
+            return
+
+        if self.workers > 1 and not self.chunk_size:
+            # tickers are matched in parallel as for the printed report, only the frames are built batch by batch
+            taxable_txs = self.get_capital_gains_and_losses()
+            if not taxable_txs:
+                yield self._get_df_from_tx_list([], exclude_columns, self.acquisition_index)
+            for start in range(0, len(taxable_txs), batch_size):
+                report_df = self._get_df_from_tx_list(
+                    taxable_txs[start:start + batch_size], exclude_columns, self.acquisition_index
+                )
+                report_df.index += start
+                yield report_df
+            return
+
+        # pairs are matched in date sold order and spilled to a temporary file per term in batches, so the report
+        # comes out in the order of get_capital_gains_and_losses, long term first, without being held in memory
+        with TemporaryFile() as long_term_file, TemporaryFile() as short_term_file:
+            spill_files = [long_term_file, short_term_file]
+            spill_batch_counts = [0, 0]
+            ticker_ranks = None  # type: Union[Dict[str, int], None]
+            with stage("match") as match_stage:
+                for batch in self._iter_day_batches(self.iter_capital_gains_and_losses(), batch_size):
+                    pairs = self._get_pairs_from_tx_list(batch)
+                    if not self.chunk_size:
+                        # a whole ledger is matched ticker by ticker for the printed report, so the pairs sold on the
+                        # same day are put in its ticker order, the tickers are known once the ledger is partitioned
+                        ticker_ranks = ticker_ranks if ticker_ranks else self._get_ticker_ranks()
+                        ranks = np.array([ticker_ranks[ticker] for ticker in pairs["cryptocurrency"]], dtype=np.int64)
+                        order = np.lexsort((ranks, pairs["date_sold"]))
+                        pairs = {col: array[order] for col, array in pairs.items()}
+                    short_term = get_short_term(pairs["date_acquired"], pairs["date_sold"])
+                    for i, term_rows in enumerate([~short_term, short_term]):
+                        if term_rows.any():
+                            pickle.dump(
+                                {col: array[term_rows] for col, array in pairs.items()},
+                                spill_files[i],
+                                protocol=pickle.HIGHEST_PROTOCOL
                             )
-                    else:
-                        self.capital_gains_and_losses.append(
-                            TaxableTransaction(ticker, first_tx_in, first_tx_out_bought_split)
-                        )
-
-        return sorted(
-            [taxable_tx for taxable_tx in self.capital_gains_and_losses if taxable_tx.capital_gain_or_loss != 0],
-            key=lambda x: (x.short_term, x.date_sold)
-        )
+                            spill_batch_counts[i] += 1
+                    match_stage.add_rows(len(batch))
+
+            # the frames are only built after matching, once every acquisition is indexed for the wash sale analysis
+            if sum(spill_batch_counts) == 0:
+                yield self._get_df_from_tx_list([], exclude_columns, self.acquisition_index)
+            row_count = 0
+            for spill_file, spill_batch_count in zip(spill_files, spill_batch_counts):
+                spill_file.seek(0)
+                for _ in range(spill_batch_count):
+                    pairs = pickle.load(spill_file)
+                    with stage("dataframe", len(pairs["cryptocurrency"])):
+                        report_df = self._get_df_from_pairs(pairs, exclude_columns, self.acquisition_index)
+                    # tx_count continues across the batches
+                    report_df.index += row_count
+                    row_count += len(report_df)
+                    yield report_df
 
     def get_taxable_income(self):
 
@@ -255,7 +569,11 @@ class TaxableCrypto(object):
         )
 
     def get_capital_gains_and_losses_df(self, exclude_columns: List[str] = None):
-        return self._get_df_from_tx_list(self.get_capital_gains_and_losses(), exclude_columns)
+        if self.kernel == "numpy":
+            return self._get_columnar_capital_gains_and_losses_df(exclude_columns)
+        return self._get_df_from_tx_list(
+            self.get_capital_gains_and_losses(), exclude_columns, self.acquisition_index
+        )
 
     def get_taxable_income_df(self, exclude_columns: List[str] = None):
         exclude_columns.extend([
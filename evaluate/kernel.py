@@ -0,0 +1,95 @@
+from datetime import date, datetime
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DateOffset, DatetimeIndex
+
+from evaluate.lots import RD, TxFlow
+from models.transactions import Transaction
+
+# volumes are matched as integer multiples of 10^-RD, so cumulative volumes are exact and leave no slivers behind
+VOLUME_UNITS = 10 ** RD
+
+KERNELS = ["object", "numpy"]
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def to_dates(timestamps: Sequence[Union[datetime, None]]) -> np.ndarray:
+    # ledger timestamps are dates, and converting their ordinals is much faster than converting datetime objects
+    ordinals = np.array(
+        [timestamp.toordinal() if timestamp is not None else EPOCH_ORDINAL for timestamp in timestamps], dtype=np.int64
+    )
+    dates = (ordinals - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[ns]")
+    dates[np.array([timestamp is None for timestamp in timestamps], dtype=bool)] = np.datetime64("NaT")
+    return dates
+
+
+def format_dates(dates: np.ndarray, date_format: str = "%m/%d/%Y") -> np.ndarray:
+    # a ledger spans a few thousand days at most, so each day is formatted once however many pairs share it
+    days, inverse = np.unique(dates.astype("datetime64[D]"), return_inverse=True)
+    formatted_days = np.array(
+        [day.strftime(date_format) if day is not None else None for day in days.tolist()], dtype=object
+    )
+    return formatted_days[inverse]
+
+
+def get_short_term(date_acquired: np.ndarray, date_sold: np.ndarray) -> np.ndarray:
+    # held for less than a year, the same as relativedelta(date_sold, date_acquired).years == 0 including leap days
+    return date_sold < (DatetimeIndex(date_acquired) + DateOffset(years=1)).values
+
+
+def get_taxable_columns(cryptocurrency: Sequence[str], lot_volume: Sequence[float], date_acquired: np.ndarray,
+                        date_sold: np.ndarray) -> Dict[str, Sequence]:
+
+    # the derived TaxableTransaction fields for a whole batch of pairs, None where the pair has no sale
+    acquired_and_sold = ~(np.isnat(date_acquired) | np.isnat(date_sold))
+    short_term = acquired_and_sold & get_short_term(date_acquired, date_sold)
+    return {
+        "lot_description": [
+            f"{round(volume, 2)} {ticker.upper()} - CRYPTO" for volume, ticker in zip(lot_volume, cryptocurrency)
+        ],
+        "date_acquired_str": format_dates(date_acquired),
+        "date_sold_str": format_dates(date_sold),
+        "short_term": np.where(acquired_and_sold, short_term, None),
+        "long_term": np.where(short_term, False, None)
+    }
+
+
+def pack_lot_arrays(txs: List[Transaction], flow: TxFlow) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # lots are bought with their currency out volume and sold with their currency in volume
+    volume_field = "currency_out_volume" if flow == TxFlow.IN else "currency_in_volume"
+    timestamps = to_dates([tx.timestamp for tx in txs])
+    volumes = np.rint(np.array([getattr(tx, volume_field) for tx in txs], dtype=float) * VOLUME_UNITS)
+    values = np.array([tx.fiat_value - tx.fiat_tx_fee for tx in txs], dtype=float)
+    return timestamps, volumes.astype(np.int64), values
+
+
+def match_lot_arrays(in_timestamps: np.ndarray, in_volumes: np.ndarray, in_values: np.ndarray,
+                     out_timestamps: np.ndarray, out_volumes: np.ndarray, out_values: np.ndarray
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+
+    # FIFO consumes the cumulative in volume in order, so the pairs are the intersections of the cumulative in and
+    # out volume intervals, returned as (lot index, sale index, volume, cost basis, sales proceeds) in match order
+    if len(out_volumes) == 0:
+        return (
+            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0)
+        )
+    in_cumsum = np.cumsum(in_volumes)
+    out_cumsum = np.cumsum(out_volumes)
+
+    # a sale can only consume lots acquired up to its own timestamp
+    acquired_volume = np.concatenate([[0], in_cumsum])[np.searchsorted(in_timestamps, out_timestamps, side="right")]
+    if np.any(out_cumsum > acquired_volume):
+        raise IndexError("Currency out transaction detected before currency in transaction, check data!")
+
+    # every lot or sale boundary up to the total sold volume ends one matched pair
+    pair_ends = np.union1d(in_cumsum[in_cumsum < out_cumsum[-1]], out_cumsum)
+    pair_ends = pair_ends[pair_ends > 0]
+    pair_volumes = np.diff(pair_ends, prepend=0)
+    in_index = np.searchsorted(in_cumsum, pair_ends, side="left")
+    out_index = np.searchsorted(out_cumsum, pair_ends, side="left")
+
+    cost_basis = in_values[in_index] * (pair_volumes / in_volumes[in_index])
+    sales_proceeds = out_values[out_index] * (pair_volumes / out_volumes[out_index])
+    return in_index, out_index, pair_volumes / VOLUME_UNITS, cost_basis, sales_proceeds
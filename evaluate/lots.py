@@ -0,0 +1,257 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from enum import Enum
+from heapq import heappop, heappush
+from operator import itemgetter
+from typing import Deque, Iterable, Iterator, List, Tuple, Union
+
+from models.transactions import Transaction
+
+RD = 8
+
+
+class TxFlow(Enum):
+    IN = "in"
+    OUT = "out"
+
+
+def scale_tx(tx: Transaction, pct: float) -> Transaction:
+    # shallow copy, only the scaled fields are replaced and everything else is shared with the original
+    return tx.replace(
+        currency_in_volume=round(float(tx.currency_in_volume * pct), RD),
+        currency_out_volume=round(float(tx.currency_out_volume * pct), RD),
+        fiat_value=round(float(tx.fiat_value * pct), RD),
+        fiat_tx_fee=round(float(tx.fiat_tx_fee * pct), RD)
+    )
+
+
+def split_unequal_tx(smaller_volume_tx: Transaction, greater_volume_tx: Transaction, greater_volume_tx_flow: TxFlow):
+    opposite_flow = None  # type: Union[None, TxFlow]
+    for flow in TxFlow:
+        if flow.value != greater_volume_tx_flow.value:
+            opposite_flow = flow
+
+    greater_volume_tx_processed_pct = (
+            getattr(smaller_volume_tx, f"currency_{greater_volume_tx_flow.value}_volume")
+            / getattr(greater_volume_tx, f"currency_{opposite_flow.value}_volume")
+    )
+
+    greater_volume_tx_unprocessed_pct = 1 - greater_volume_tx_processed_pct
+
+    greater_volume_tx_processed_split = scale_tx(greater_volume_tx, greater_volume_tx_processed_pct)
+    greater_volume_tx_unprocessed_split = scale_tx(greater_volume_tx, greater_volume_tx_unprocessed_pct)
+
+    return greater_volume_tx_processed_split, greater_volume_tx_unprocessed_split
+
+
+class LotMatcher(ABC):
+
+    @abstractmethod
+    def __init__(self):
+        self.lots = None
+
+    def add_lot(self, tx_in: Transaction):
+        # lots without volume at RD decimals cannot be sold, like in the numpy kernel they never become pairs
+        if round(tx_in.currency_out_volume, RD) != 0:
+            self._add_lot(tx_in)
+
+    @abstractmethod
+    def _add_lot(self, tx_in: Transaction):
+        pass
+
+    @abstractmethod
+    def _get_next_lot(self) -> Transaction:
+        pass
+
+    @abstractmethod
+    def _remove_next_lot(self):
+        pass
+
+    @abstractmethod
+    def _replace_next_lot(self, tx_in: Transaction):
+        pass
+
+    @abstractmethod
+    def get_open_lots(self) -> List[Transaction]:
+        pass
+
+    def match(self, tx_out: Transaction) -> List[Tuple[Transaction, Transaction]]:
+
+        matches = []
+        # a sale without volume sells nothing, and neither does the rest of a sale that rounds to no volume
+        while tx_out is not None and round(tx_out.currency_in_volume, RD) != 0:
+
+            if len(self.lots) == 0:
+                raise IndexError("Currency out transaction detected before currency in transaction, check data!")
+
+            next_tx_in = self._get_next_lot()
+
+            if next_tx_in.currency_out_volume == tx_out.currency_in_volume:
+                self._remove_next_lot()
+                matches.append((next_tx_in, tx_out))
+                tx_out = None
+
+            elif next_tx_in.currency_out_volume > tx_out.currency_in_volume:
+                next_tx_in_sold_split, next_tx_in_unsold_split = split_unequal_tx(
+                    smaller_volume_tx=tx_out, greater_volume_tx=next_tx_in, greater_volume_tx_flow=TxFlow.IN
+                )
+                # a partially consumed lot stays in place as its unsold split, unless nothing of it is left
+                if round(next_tx_in_unsold_split.currency_out_volume, RD) != 0:
+                    self._replace_next_lot(next_tx_in_unsold_split)
+                else:
+                    self._remove_next_lot()
+                matches.append((next_tx_in_sold_split, tx_out))
+                tx_out = None
+
+            else:
+                tx_out_bought_split, tx_out_unbought_split = split_unequal_tx(
+                    smaller_volume_tx=next_tx_in, greater_volume_tx=tx_out, greater_volume_tx_flow=TxFlow.OUT
+                )
+                self._remove_next_lot()
+                matches.append((next_tx_in, tx_out_bought_split))
+                tx_out = tx_out_unbought_split
+
+        return matches
+
+
+class FifoLotMatcher(LotMatcher):
+
+    def __init__(self, lots: Iterable[Transaction] = None):
+        super().__init__()
+        self.lots = deque(lots if lots else [])  # type: Deque[Transaction]
+
+    def _add_lot(self, tx_in: Transaction):
+        self.lots.append(tx_in)
+
+    def _get_next_lot(self) -> Transaction:
+        return self.lots[0]
+
+    def _remove_next_lot(self):
+        self.lots.popleft()
+
+    def _replace_next_lot(self, tx_in: Transaction):
+        self.lots[0] = tx_in
+
+    def get_open_lots(self) -> List[Transaction]:
+        return list(self.lots)
+
+
+class LifoLotMatcher(LotMatcher):
+
+    def __init__(self, lots: Iterable[Transaction] = None):
+        super().__init__()
+        self.lots = list(lots if lots else [])  # type: List[Transaction]
+
+    def _add_lot(self, tx_in: Transaction):
+        self.lots.append(tx_in)
+
+    def _get_next_lot(self) -> Transaction:
+        return self.lots[-1]
+
+    def _remove_next_lot(self):
+        self.lots.pop()
+
+    def _replace_next_lot(self, tx_in: Transaction):
+        self.lots[-1] = tx_in
+
+    def get_open_lots(self) -> List[Transaction]:
+        return list(self.lots)
+
+
+class HifoLotMatcher(LotMatcher):
+
+    def __init__(self, lots: Iterable[Transaction] = None):
+        super().__init__()
+        # max-heap on unit cost as (negative unit cost, lot count, lot), ties go to the earliest acquired lot
+        self.lots = []  # type: List[Tuple[float, int, Transaction]]
+        self._lot_count = 0
+        for tx_in in lots if lots else []:
+            self.add_lot(tx_in)
+
+    def _add_lot(self, tx_in: Transaction):
+        unit_cost = tx_in.get_final_value() / tx_in.currency_out_volume if tx_in.currency_out_volume else 0
+        heappush(self.lots, (-unit_cost, self._lot_count, tx_in))
+        self._lot_count += 1
+
+    def _get_next_lot(self) -> Transaction:
+        return self.lots[0][2]
+
+    def _remove_next_lot(self):
+        heappop(self.lots)
+
+    def _replace_next_lot(self, tx_in: Transaction):
+        # the unsold split keeps the unit cost and position of the lot it was split from
+        self.lots[0] = self.lots[0][:2] + (tx_in,)
+
+    def get_open_lots(self) -> List[Transaction]:
+        return [tx_in for _, _, tx_in in sorted(self.lots, key=itemgetter(1))]
+
+
+COST_BASIS_METHODS = OrderedDict([
+    ("fifo", FifoLotMatcher),
+    ("lifo", LifoLotMatcher),
+    ("hifo", HifoLotMatcher)
+])
+
+
+def match_lots(txs_in: Iterable[Transaction], txs_out: Iterable[Transaction],
+               lot_matcher: LotMatcher = None) -> Iterator[Tuple[Transaction, Transaction]]:
+
+    # both iterables must be sorted by timestamp, lots are only opened once their timestamp is reached
+    lot_matcher = lot_matcher if lot_matcher is not None else FifoLotMatcher()
+    txs_in = iter(txs_in)
+    next_tx_in = next(txs_in, None)  # type: Union[Transaction, None]
+    for tx_out in txs_out:
+        while next_tx_in is not None and next_tx_in.timestamp <= tx_out.timestamp:
+            lot_matcher.add_lot(next_tx_in)
+            next_tx_in = next(txs_in, None)
+        yield from lot_matcher.match(tx_out)
+
+    # lots acquired after the last currency out transaction stay open
+    if next_tx_in is not None:
+        lot_matcher.add_lot(next_tx_in)
+        for tx_in in txs_in:
+            lot_matcher.add_lot(tx_in)
+
+
+def pack_lots(txs: Iterable[Transaction]) -> List[Tuple[float, float, float, float, float]]:
+    # only the fields needed for matching are sent to worker processes, not the pickled transactions
+    return [
+        (tx.timestamp.timestamp(), tx.currency_in_volume, tx.currency_out_volume, tx.fiat_value, tx.fiat_tx_fee)
+        for tx in txs
+    ]
+
+
+def unpack_lot(tx: Transaction, packed_split: Tuple[float, float, float, float]) -> Transaction:
+    currency_in_volume, currency_out_volume, fiat_value, fiat_tx_fee = packed_split
+    if (tx.currency_in_volume == currency_in_volume and tx.currency_out_volume == currency_out_volume
+            and tx.fiat_value == fiat_value and tx.fiat_tx_fee == fiat_tx_fee):
+        return tx
+    return tx.replace(
+        currency_in_volume=currency_in_volume,
+        currency_out_volume=currency_out_volume,
+        fiat_value=fiat_value,
+        fiat_tx_fee=fiat_tx_fee
+    )
+
+
+def match_packed_lots(packed_txs_in: List[tuple], packed_txs_out: List[tuple],
+                      cost_basis_method: str = "fifo") -> List[tuple]:
+
+    # tx_id holds the index of the packed lot so that matches can be mapped back to the original transactions
+    txs_in, txs_out = [
+        [
+            Transaction(i, None, timestamp, fiat_value, fiat_tx_fee, "", currency_in_volume, 0, "",
+                        currency_out_volume, 0, False)
+            for i, (timestamp, currency_in_volume, currency_out_volume, fiat_value, fiat_tx_fee) in enumerate(packed)
+        ]
+        for packed in [packed_txs_in, packed_txs_out]
+    ]
+
+    return [
+        (
+            tx_in.tx_id, tx_in.currency_in_volume, tx_in.currency_out_volume, tx_in.fiat_value, tx_in.fiat_tx_fee,
+            tx_out.tx_id, tx_out.currency_in_volume, tx_out.currency_out_volume, tx_out.fiat_value, tx_out.fiat_tx_fee
+        )
+        for tx_in, tx_out in match_lots(txs_in, txs_out, COST_BASIS_METHODS[cost_basis_method]())
+    ]
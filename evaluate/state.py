@@ -0,0 +1,62 @@
+import os
+import pickle
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, List, Union
+
+from models.transactions import Transaction
+
+STATE_DIR = Path(__file__).parent.parent / "state"
+STATE_VERSION = 2
+
+
+def _get_open_lots_file_path(state_dir: Path, fiat_currency: str, year: int, source_id: Union[str, None]) -> Path:
+    # every ledger keeps its own open lots, e.g. two portfolios in the same fiat currency
+    source_key = sha1(source_id.encode("utf-8")).hexdigest()[:12] if source_id else "memory"
+    return state_dir / f"{year}-{fiat_currency.lower()}-{source_key}-open_lots.pkl"
+
+
+def save_open_lots(open_lots: Dict[str, List[Transaction]], fiat_currency: str, year: int, cost_basis_method: str,
+                   source_id: Union[str, None], state_dir: Path = STATE_DIR):
+
+    if not state_dir.exists():
+        os.makedirs(state_dir)
+
+    with open(_get_open_lots_file_path(state_dir, fiat_currency, year, source_id), "wb") as open_lots_file:
+        pickle.dump({
+            "version": STATE_VERSION,
+            "cost_basis_method": cost_basis_method,
+            "source_id": source_id,
+            "open_lots": {ticker: list(lots) for ticker, lots in open_lots.items() if lots}
+        }, open_lots_file)
+
+
+def load_open_lots(fiat_currency: str, year: int, cost_basis_method: str, source_id: Union[str, None],
+                   state_dir: Path = STATE_DIR) -> Dict[str, List[Transaction]]:
+
+    open_lots_file_path = _get_open_lots_file_path(state_dir, fiat_currency, year, source_id)
+    if not open_lots_file_path.exists():
+        raise FileNotFoundError(
+            f"No open lots saved for the end of {year}, run tax year {year} with saving of open lots first!"
+        )
+
+    with open(open_lots_file_path, "rb") as open_lots_file:
+        state = pickle.load(open_lots_file)
+
+    # lots left over by one cost basis method or ledger are not the open lots of another
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        raise ValueError(
+            f"Open lots saved for the end of {year} are from an older version, run tax year {year} with saving "
+            f"of open lots again!"
+        )
+    if state["cost_basis_method"] != cost_basis_method:
+        raise ValueError(
+            f"Open lots saved for the end of {year} were matched with {state['cost_basis_method']}, not "
+            f"{cost_basis_method}, run tax year {year} with saving of open lots and {cost_basis_method} first!"
+        )
+    if state["source_id"] != source_id:
+        raise ValueError(
+            f"Open lots saved for the end of {year} are from {state['source_id']}, not {source_id}, run tax year "
+            f"{year} with saving of open lots for this ledger first!"
+        )
+    return state["open_lots"]
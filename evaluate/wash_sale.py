@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from evaluate.kernel import VOLUME_UNITS, to_dates
+from models.transactions import Transaction
+from utils.profiler import profile_stage
+
+# a loss is disallowed when the same currency is acquired 30 days before or after the sale
+WASH_SALE_DAYS = 30
+
+# lot days are combined with sale days into one sortable key, ledger days since 1970 stay far below it
+DAY_KEY = 10 ** 6
+
+
+def to_days(dates: np.ndarray) -> np.ndarray:
+    return dates.astype("datetime64[D]").astype(np.int64)
+
+
+def to_units(volumes: np.ndarray) -> np.ndarray:
+    # held volumes are differences of large cumulative sums, integer units keep them exact like the numpy kernel
+    return np.rint(np.asarray(volumes, dtype=float) * VOLUME_UNITS).astype(np.int64)
+
+
+class AcquisitionIndex(object):
+
+    def __init__(self, window_days: int = WASH_SALE_DAYS):
+        self.window_days = window_days
+        self._acquisitions = defaultdict(list)  # type: Dict[str, List[Tuple[datetime, float]]]
+        # every matched pair as (date acquired, date sold, volume), including pairs outside the tax year, so that
+        # only acquisitions still held after a sale count as its replacement
+        self._sales = defaultdict(list)  # type: Dict[str, List[Tuple[datetime, datetime, float]]]
+        self._sale_arrays = defaultdict(list)  # type: Dict[str, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]]
+        # per ticker, sorted arrays whose cumulative volume units answer every window with two binary searches
+        self._series = {}  # type: Dict[str, Dict[str, np.ndarray]]
+
+    def add(self, ticker: str, timestamp: datetime, volume: float):
+        ticker = ticker.lower()
+        self._acquisitions[ticker].append((timestamp, volume))
+        self._series.pop(ticker, None)
+
+    def add_lots(self, ticker: str, txs_in: Iterable[Transaction]):
+        for tx in txs_in:
+            self.add(ticker, tx.timestamp, tx.currency_out_volume)
+
+    def add_sale(self, ticker: str, date_acquired: datetime, date_sold: datetime, volume: float):
+        ticker = ticker.lower()
+        self._sales[ticker].append((date_acquired, date_sold, volume))
+        self._series.pop(ticker, None)
+
+    def add_sales(self, ticker: str, date_acquired: np.ndarray, date_sold: np.ndarray, volume: np.ndarray):
+        # the pairs of the numpy kernel, already as arrays
+        ticker = ticker.lower()
+        self._sale_arrays[ticker].append((date_acquired, date_sold, volume))
+        self._series.pop(ticker, None)
+
+    def get_acquisitions(self, ticker: str) -> List[Tuple[datetime, float]]:
+        return list(self._acquisitions.get(ticker.lower(), []))
+
+    def get_sales(self, ticker: str) -> List[Tuple[np.datetime64, np.datetime64, float]]:
+        lot_days, sale_days, volumes = self._get_sales(ticker.lower())
+        return list(zip(
+            lot_days.astype("datetime64[D]").tolist(), sale_days.astype("datetime64[D]").tolist(), volumes.tolist()
+        ))
+
+    def _get_sales(self, ticker: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        sales = self._sales.get(ticker, [])
+        sale_arrays = [(
+            to_days(to_dates([date_acquired for date_acquired, _, _ in sales])),
+            to_days(to_dates([date_sold for _, date_sold, _ in sales])),
+            np.array([volume for _, _, volume in sales], dtype=float)
+        )] + [
+            (to_days(date_acquired), to_days(date_sold), np.asarray(volume, dtype=float))
+            for date_acquired, date_sold, volume in self._sale_arrays.get(ticker, [])
+        ]
+        return tuple(np.concatenate(arrays) for arrays in zip(*sale_arrays))
+
+    def _get_series(self, ticker: str) -> Dict[str, np.ndarray]:
+        if ticker in self._series:
+            return self._series[ticker]
+
+        acquisitions = self._acquisitions.get(ticker, [])
+        acquisition_days = to_days(to_dates([timestamp for timestamp, _ in acquisitions]))
+        acquisition_volumes = to_units([volume for _, volume in acquisitions])
+        lot_days, sale_days, sale_volumes = self._get_sales(ticker)
+        sale_volumes = to_units(sale_volumes)
+
+        # the volume acquired within the window before a day and still held at its end changes by a step when a lot
+        # is acquired, sold or leaves the window, e.g. a sale only lowers it until the day its lot leaves the window
+        window_end = lot_days + self.window_days + 1
+        sold_in_window = sale_days < window_end
+        held_days = np.concatenate([
+            acquisition_days, acquisition_days + self.window_days + 1, sale_days[sold_in_window],
+            window_end[sold_in_window]
+        ])
+        held_steps = np.concatenate([
+            acquisition_volumes, -acquisition_volumes, -sale_volumes[sold_in_window], sale_volumes[sold_in_window]
+        ])
+
+        acquisition_order = np.argsort(acquisition_days, kind="stable")
+        held_order = np.argsort(held_days, kind="stable")
+        sale_keys = lot_days * DAY_KEY + sale_days
+        sale_order = np.argsort(sale_keys, kind="stable")
+        self._series[ticker] = {
+            "acquisition_days": acquisition_days[acquisition_order],
+            "acquired_volumes": np.concatenate([[0], np.cumsum(acquisition_volumes[acquisition_order])]),
+            "held_days": held_days[held_order],
+            "held_volumes": np.concatenate([[0], np.cumsum(held_steps[held_order])]),
+            "sale_keys": sale_keys[sale_order],
+            "sold_volumes": np.concatenate([[0], np.cumsum(sale_volumes[sale_order])])
+        }
+        return self._series[ticker]
+
+    @staticmethod
+    def _get_acquired_units(series: Dict[str, np.ndarray], start_days: np.ndarray, end_days: np.ndarray) -> np.ndarray:
+        # volume acquired from start through end, both inclusive
+        return (
+            series["acquired_volumes"][np.searchsorted(series["acquisition_days"], end_days, side="right")]
+            - series["acquired_volumes"][np.searchsorted(series["acquisition_days"], start_days, side="left")]
+        )
+
+    def get_replacement_volume(self, ticker: str, date_acquired: np.ndarray, date_sold: np.ndarray) -> np.ndarray:
+
+        series = self._get_series(ticker.lower())
+        lot_days = to_days(date_acquired)
+        sale_days = to_days(date_sold)
+
+        # acquired within the window before the sale and not sold by the end of its day
+        held_units = series["held_volumes"][np.searchsorted(series["held_days"], sale_days, side="right")]
+        # the unsold rest of the sold lot is not a replacement, acquisitions of one day are treated as one lot
+        lot_units = self._get_acquired_units(series, lot_days, lot_days) - (
+            series["sold_volumes"][np.searchsorted(series["sale_keys"], lot_days * DAY_KEY + sale_days, side="right")]
+            - series["sold_volumes"][np.searchsorted(series["sale_keys"], lot_days * DAY_KEY, side="left")]
+        )
+        held_units -= np.where(lot_days >= sale_days - self.window_days, lot_units, 0)
+        # acquired after the sale within the window, whether or not it was sold again
+        acquired_units = self._get_acquired_units(series, sale_days + 1, sale_days + self.window_days)
+        return np.maximum(held_units + acquired_units, 0) / VOLUME_UNITS
+
+    @profile_stage("wash_sales", rows=lambda self, cryptocurrency, *args: len(cryptocurrency))
+    def get_wash_sales(self, cryptocurrency: Sequence[str], date_acquired: np.ndarray, date_sold: np.ndarray,
+                       volume: Sequence[float], capital_gain_or_loss: Sequence) -> Dict[str, np.ndarray]:
+
+        cryptocurrency = np.asarray(cryptocurrency, dtype=object)
+        volume = np.asarray(volume, dtype=float)
+        capital_gain_or_loss = np.array(
+            [np.nan if gain is None else gain for gain in capital_gain_or_loss], dtype=float
+        )
+
+        loss_rows = np.flatnonzero(capital_gain_or_loss < 0)
+        repurchased_volume = np.zeros(len(cryptocurrency))
+        for ticker in np.unique(cryptocurrency[loss_rows]):
+            rows = loss_rows[cryptocurrency[loss_rows] == ticker]
+            repurchased_volume[rows] = self.get_replacement_volume(ticker, date_acquired[rows], date_sold[rows])
+
+        # the loss is disallowed in proportion to the sold volume that was repurchased
+        wash_sale = repurchased_volume > 0
+        repurchased_pct = np.minimum(repurchased_volume / np.where(volume > 0, volume, 1), 1)
+        return {
+            "wash_sale": wash_sale,
+            "disallowed_loss": np.where(wash_sale, np.round(-capital_gain_or_loss * repurchased_pct), 0)
+        }
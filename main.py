@@ -1,9 +1,10 @@
 import argparse
+import cProfile
 import os
 import sys
 from pathlib import Path
 
-from evaluate.capital import TaxableCrypto
+from utils.profiler import PROFILER, stage
 
 
 def main(argv):
@@ -40,7 +41,17 @@ def main(argv):
         "--lifo",
         "-l",
         action="store_true",
-        help="(Optional) Boolean switch to turn on LIFO (descending). Default = FIFO (ascending)."
+        help=("(Optional) Boolean switch to turn on LIFO (descending), same as --cost_basis lifo. "
+              "Default = FIFO (ascending).")
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--cost_basis",
+        "-b",
+        type=str,
+        choices=["fifo", "lifo", "hifo"],
+        help="(Optional) Cost basis method used to match sold currency against open lots. Default = \"fifo\"."
     )
 
     # optional argument
@@ -61,51 +72,337 @@ def main(argv):
         help="(Optional) Boolean switch to turn on export to CSV."
     )
 
+    # optional argument
+    arg_parser.add_argument(
+        "--format",
+        type=str,
+        choices=["csv", "jsonl", "parquet"],
+        default="csv",
+        help="(Optional) File format of the export, written batch by batch. Used with --export. Default = csv."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["gzip", "zstd"],
+        help=("(Optional) Compression of the export, zstd CSV and JSON lines require the zstandard package. "
+              "Used with --export. Default = None.")
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=100_000,
+        help="(Optional) Number of capital gains and losses converted and written per batch. Default = 100000."
+    )
+
+    # switch
+    arg_parser.add_argument(
+        "--offline",
+        "-o",
+        action="store_true",
+        help="(Optional) Boolean switch to only read data from the local cache of the data source."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--chunk_size",
+        "-c",
+        type=int,
+        help=("(Optional) Number of rows per chunk to stream file data sources sorted by date with bounded memory. "
+              "Default = load the whole ledger.")
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help=("(Optional) Number of worker processes to match tickers in parallel, 0 = all cores. "
+              "Also used with --export. Not used with --chunk_size. Default = 1.")
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--kernel",
+        "-k",
+        type=str,
+        choices=["object", "numpy"],
+        default="object",
+        help=("(Optional) Matching kernel, \"numpy\" matches FIFO lots of each ticker with vectorized array "
+              "operations instead of transaction objects. Not used with --chunk_size or --save_state. "
+              "Default = \"object\".")
+    )
+
+    # switch
+    arg_parser.add_argument(
+        "--wash_sales",
+        action="store_true",
+        help=("(Optional) Boolean switch to flag capital losses with repurchases of the same currency within 30 days "
+              "before or after the sale, and report the disallowed part of the loss.")
+    )
+
+    # switch
+    arg_parser.add_argument(
+        "--save_state",
+        action="store_true",
+        help="(Optional) Boolean switch to save the open lots at the end of the tax year. Requires --tax_year."
+    )
+
+    # switch
+    arg_parser.add_argument(
+        "--resume",
+        "-r",
+        action="store_true",
+        help=("(Optional) Boolean switch to resume from the open lots saved for the prior year and only process "
+              "the tax year's transactions. Requires --tax_year.")
+    )
+
+    # switch
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="(Optional) Boolean switch to print the time and rows per stage (OAuth, fetch, normalization, "
+             "extraction, matching, DataFrame building) to stderr."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--profile_output",
+        type=str,
+        help="(Optional) File to dump cProfile stats to, readable with pstats or snakeviz. Default = None."
+    )
+
+    # optional argument
+    arg_parser.add_argument(
+        "--prices",
+        type=str,
+        help="(Optional) SQLite price store filling missing and zero \"Daily Avg.\" prices of the ledger, e.g. "
+             "prices/prices.sqlite, see the load_prices command. Default = None."
+    )
+
+    subparsers = arg_parser.add_subparsers(dest="command", title="commands")
+
+    load_prices_parser = subparsers.add_parser(
+        "load_prices",
+        help="Load daily price dumps into the SQLite price store given by --prices."
+    )
+
+    # positional argument
+    load_prices_parser.add_argument(
+        "files",
+        type=str,
+        nargs="+",
+        help="CSV price dumps with date, ticker and price columns."
+    )
+
+    # optional argument
+    load_prices_parser.add_argument(
+        "--ticker",
+        type=str,
+        help="(Optional) Ticker of price dumps without a ticker column. Default = None."
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve capital gains and taxable income as JSON over HTTP, keeping the ledger in memory between requests."
+    )
+
+    # optional argument
+    serve_parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="(Optional) Address the server listens on. Default = 127.0.0.1."
+    )
+
+    # optional argument
+    serve_parser.add_argument(
+        "--port",
+        "-p",
+        type=int,
+        default=8000,
+        help="(Optional) Port the server listens on. Default = 8000."
+    )
+
+    # optional argument
+    serve_parser.add_argument(
+        "--reload_interval",
+        type=float,
+        default=30.0,
+        help="(Optional) Seconds between checks whether the data source changed, the ledger is only reloaded when "
+             "it did. Default = 30."
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help="Calculate capital gains/losses and taxable income of every portfolio in a manifest."
+    )
+
+    # positional argument
+    batch_parser.add_argument(
+        "manifest",
+        type=str,
+        help="JSON list of portfolios with their source (csv, parquet or sheets), path or sheet_id and ranges, "
+             "tax_year, fiat_currency and cost_basis."
+    )
+
+    # optional argument
+    batch_parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=str(Path(__file__).parent / "output" / "batch"),
+        help="(Optional) Directory of the per-portfolio outputs and summary.json. Default = output/batch."
+    )
+
+    # optional argument
+    batch_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="(Optional) Number of processes computing portfolios of different sources concurrently, 0 uses "
+             "every CPU. Default = 1."
+    )
+
     args = arg_parser.parse_args(argv)
 
+    if (args.save_state or args.resume) and not args.tax_year:
+        arg_parser.error("--save_state and --resume require --tax_year")
+    cost_basis_method = args.cost_basis if args.cost_basis else "lifo" if args.lifo else "fifo"
+    if args.kernel == "numpy" and (cost_basis_method != "fifo" or args.chunk_size or args.save_state):
+        arg_parser.error("--kernel numpy only supports fifo without --chunk_size or --save_state")
+
+    if args.command == "load_prices":
+        from data.prices import PRICES_DB_PATH, PriceStore
+
+        price_store = PriceStore(args.prices if args.prices else PRICES_DB_PATH)
+        for file_path in args.files:
+            row_count = price_store.load_csv(
+                file_path, fiat_currency=args.fiat_currency if args.fiat_currency else "usd", ticker=args.ticker
+            )
+            print(f"Loaded {row_count} prices from {file_path} into {price_store.db_path}")
+        price_store.close()
+        return None, None
+
+    price_store = None
+    if args.prices:
+        from data.prices import PriceStore
+        price_store = PriceStore(args.prices)
+
+    if args.command == "serve":
+        from api.server import LedgerService, serve
+
+        # GET /capital_gains?year=&currency=&strategy=, GET /taxable_income?year=&currency=, GET /health, POST /reload
+        serve(args.host, args.port, LedgerService(
+            offline=args.offline,
+            workers=args.workers,
+            expenditure_types=args.expenditure_types if args.expenditure_types else [],
+            reload_interval=args.reload_interval,
+            price_store=price_store
+        ))
+        return None, None
+
+    if args.command == "batch":
+        from api.batch import load_manifest, run_batch
+
+        summary = run_batch(
+            load_manifest(args.manifest), args.output_dir, jobs=args.jobs, workers=args.workers,
+            price_db_path=args.prices
+        )
+        print(
+            f"{summary['succeeded']}/{summary['portfolios']} portfolios in {summary['seconds']}s "
+            f"({summary['portfolios_per_second']} portfolios/s), failed: {', '.join(summary['failed']) or 'none'}"
+        )
+        return None, None
+
+    # pandas and the data source clients are only imported once the arguments are valid, not for --help
+    from evaluate.capital import TaxableCrypto
+
+    if args.profile:
+        PROFILER.enable()
+    profile = cProfile.Profile() if args.profile_output else None
+    if profile:
+        profile.enable()
+
     taxable_crypto = TaxableCrypto(
         tax_year=args.tax_year,
         fiat_currency=args.fiat_currency if args.fiat_currency else "usd",
         sort_field=args.sort_field if args.sort_field else "timestamp",
         sort_direction="ascending" if args.lifo else "descending",
-        expenditure_types=args.expenditure_types if args.expenditure_types else []
-    )
-
-    capital_gains_and_losses_df = taxable_crypto.get_capital_gains_and_losses_df(
-        exclude_columns=["cryptocurrency", "date_acquired", "date_sold"]
-    )
-
-    taxable_income_df = taxable_crypto.get_taxable_income_df(
-        exclude_columns=["cryptocurrency", "date_acquired", "date_sold"]
+        expenditure_types=args.expenditure_types if args.expenditure_types else [],
+        offline=args.offline,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        save_state=args.save_state,
+        resume=args.resume,
+        cost_basis_method=cost_basis_method,
+        price_store=price_store,
+        kernel=args.kernel,
+        wash_sales=args.wash_sales
     )
 
     if args.export:
+        from data.export import ReportWriter, get_export_file_name
+
         output_dir = Path(__file__).parent / "output"
         if not output_dir.exists():
             os.makedirs(output_dir)
+        file_prefix = (
+            f"{f'{args.tax_year}-' if args.tax_year else ''}"
+            f"cryptocurrency{f'_to_{args.fiat_currency}' if args.fiat_currency else ''}-"
+        )
 
-        capital_gains_and_losses_df.to_csv(
-            output_dir / (
-                f"{f'{args.tax_year}-' if args.tax_year else ''}"
-                f"cryptocurrency{f'_to_{args.fiat_currency}' if args.fiat_currency else ''}-"
-                f"capital_gains_and_losses.csv"
+        # the capital gains and losses are written batch by batch as they are matched, never as one frame
+        with stage("export") as export_stage:
+            capital_gains_and_losses_path = output_dir / get_export_file_name(
+                f"{file_prefix}capital_gains_and_losses", args.format, args.compression
             )
-        )
+            with ReportWriter(capital_gains_and_losses_path, args.format, args.compression) as writer:
+                for capital_gains_and_losses_df in taxable_crypto.iter_capital_gains_and_losses_dfs(
+                        exclude_columns=["cryptocurrency", "date_acquired", "date_sold"], batch_size=args.batch_size
+                ):
+                    writer.write(capital_gains_and_losses_df)
+            print(f"Exported {writer.row_count} capital gains and losses to {capital_gains_and_losses_path}")
+            export_stage.add_rows(writer.row_count)
 
-        taxable_income_df.to_csv(
-            output_dir / (
-                f"{f'{args.tax_year}-' if args.tax_year else ''}"
-                f"cryptocurrency{f'_to_{args.fiat_currency}' if args.fiat_currency else ''}-"
-                f"taxable_income.csv"
+            taxable_income_path = output_dir / get_export_file_name(
+                f"{file_prefix}taxable_income", args.format, args.compression
             )
+            with ReportWriter(taxable_income_path, args.format, args.compression) as writer:
+                writer.write(taxable_crypto.get_taxable_income_df(
+                    exclude_columns=["cryptocurrency", "date_acquired", "date_sold"]
+                ))
+            print(f"Exported {writer.row_count} taxable income transactions to {taxable_income_path}")
+            export_stage.add_rows(writer.row_count)
+
+        capital_gains_and_losses_df, taxable_income_df = None, None
+
+    else:
+        capital_gains_and_losses_df = taxable_crypto.get_capital_gains_and_losses_df(
+            exclude_columns=["cryptocurrency", "date_acquired", "date_sold"]
+        )
+
+        taxable_income_df = taxable_crypto.get_taxable_income_df(
+            exclude_columns=["cryptocurrency", "date_acquired", "date_sold"]
         )
 
+    if profile:
+        profile.disable()
+        profile.dump_stats(args.profile_output)
+    if args.profile:
+        print(PROFILER.report(), file=sys.stderr)
+
     return capital_gains_and_losses_df, taxable_income_df
 
 
 if __name__ == "__main__":
     capital_gains_and_losses_output, taxable_income_output = main(sys.argv[1:])
-    print(capital_gains_and_losses_output.to_string())
-    print("-" * 100)
-    print(taxable_income_output.to_string())
-    print()
+    if capital_gains_and_losses_output is not None:
+        print(capital_gains_and_losses_output.to_string())
+        print("-" * 100)
+        print(taxable_income_output.to_string())
+        print()
@@ -1,4 +1,6 @@
+from copy import copy
 from datetime import datetime
+from sys import intern
 from typing import Union
 
 from dateutil.relativedelta import relativedelta
@@ -10,6 +12,21 @@ NEWLINE = "\n"
 
 
 class Transaction(object):
+    __slots__ = (
+        "tx_id",
+        "tx_type",
+        "timestamp",
+        "fiat_value",
+        "fiat_tx_fee",
+        "currency_in",
+        "currency_in_volume",
+        "currency_in_fiat_price",
+        "currency_out",
+        "currency_out_volume",
+        "currency_out_fiat_price",
+        "taxable",
+        "description"
+    )
 
     def __init__(self, tx_id: int, tx_type: TxType, timestamp: Union[str, datetime], fiat_value: float,
                  fiat_tx_fee: float, currency_in: str, currency_in_volume: float, currency_in_fiat_price: float,
@@ -23,15 +40,24 @@ class Transaction(object):
             self.timestamp = timestamp  # type: datetime
         self.fiat_value = fiat_value
         self.fiat_tx_fee = fiat_tx_fee
-        self.currency_in = str.upper(currency_in)
+        self.currency_in = intern(str.upper(currency_in))
         self.currency_in_volume = currency_in_volume
         self.currency_in_fiat_price = currency_in_fiat_price
-        self.currency_out = str.upper(currency_out)
+        self.currency_out = intern(str.upper(currency_out))
         self.currency_out_volume = currency_out_volume
         self.currency_out_fiat_price = currency_out_fiat_price
         self.taxable = taxable
         self.description = description
 
+    def replace(self, **changes) -> "Transaction":
+        tx = copy(self)
+        for field, value in changes.items():
+            setattr(tx, field, value)
+        return tx
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in Transaction.__slots__}
+
     def get_final_value(self) -> float:
         return self.fiat_value - self.fiat_tx_fee
 
@@ -41,19 +67,20 @@ class Transaction(object):
     def __repr__(self):
         return (
             f"{self.__class__.__name__}("
-            f"{', '.join([f'{k}={v}' for k, v in self.__dict__.items() if v is not None])}"
+            f"{', '.join([f'{k}={v}' for k, v in self.to_dict().items() if v is not None])}"
             f")"
         )
 
     # def __str__(self):
     #     return (
     #         f"{self.__class__.__name__}: {{{NEWLINE}  "
-    #         f"{f',{NEWLINE}  '.join([f'{k}: {v}' for k, v in self.__dict__.items() if v is not None])}"
+    #         f"{f',{NEWLINE}  '.join([f'{k}: {v}' for k, v in self.to_dict().items() if v is not None])}"
     #         f"{NEWLINE}}}"
     #     )
 
 
 class Buy(Transaction):
+    __slots__ = ()
 
     def __init__(self, tx_id: int, timestamp: Union[str, datetime], fiat_value: float, fiat_tx_fee: float,
                  currency_in: str, currency_in_volume: float, currency_in_fiat_price: float, currency_out: str,
@@ -65,6 +92,7 @@ class Buy(Transaction):
 
 
 class Sell(Transaction):
+    __slots__ = ()
 
     def __init__(self, tx_id: int, timestamp: Union[str, datetime], fiat_value: float, fiat_tx_fee: float,
                  currency_in: str, currency_in_volume: float, currency_in_fiat_price: float, currency_out: str,
@@ -76,6 +104,7 @@ class Sell(Transaction):
 
 
 class Trade(Transaction):
+    __slots__ = ()
 
     def __init__(self, tx_id: int, timestamp: Union[str, datetime], fiat_value: float, fiat_tx_fee: float,
                  currency_in: str, currency_in_volume: float, currency_in_fiat_price: float, currency_out: str,
@@ -87,6 +116,7 @@ class Trade(Transaction):
 
 
 class Transact(Transaction):
+    __slots__ = ()
 
     def __init__(self, tx_id: int, timestamp: Union[str, datetime], fiat_value: float, fiat_tx_fee: float,
                  currency_in: str, currency_in_volume: float, currency_in_fiat_price: float, currency_out: str,
@@ -98,43 +128,89 @@ class Transact(Transaction):
 
 
 class TaxableTransaction(object):
+    __slots__ = (
+        "cryptocurrency",
+        "tx_in",
+        "tx_out",
+        "date_acquired",
+        "date_sold",
+        "sales_proceeds",
+        "cost_basis",
+        "capital_gain_or_loss"
+    )
+
+    # the term flags and the strings are derived on access, batches of pairs derive them with get_taxable_columns
+    FIELDS = (
+        "cryptocurrency",
+        "tx_in",
+        "tx_out",
+        "date_acquired",
+        "date_acquired_str",
+        "date_sold",
+        "date_sold_str",
+        "sales_proceeds",
+        "cost_basis",
+        "short_term",
+        "long_term",
+        "capital_gain_or_loss",
+        "lot_description"
+    )
 
     def __init__(self, cryptocurrency: str, tx_in: Transaction, tx_out: Union[Transaction, None]):
         self.cryptocurrency = cryptocurrency
         self.tx_in = tx_in
         self.tx_out = tx_out
         self.date_acquired = self.tx_in.timestamp if self.tx_in else None
-        self.date_acquired_str = self.tx_in.timestamp.strftime("%m/%d/%Y") if self.tx_in else None
         self.date_sold = self.tx_out.timestamp if self.tx_out else None
-        self.date_sold_str = self.tx_out.timestamp.strftime("%m/%d/%Y") if self.tx_out else None
         self.sales_proceeds = round(self.tx_out.fiat_value - self.tx_out.fiat_tx_fee) if self.tx_out else None
         self.cost_basis = round(self.tx_in.fiat_value - self.tx_in.fiat_tx_fee) if self.tx_in else None
-        self.short_term = (
-            relativedelta(self.date_sold, self.date_acquired).years == 0
-            if self.date_sold and self.date_acquired_str
-            else None
-        )
-        self.long_term = not self.short_term if self.short_term else None
         self.capital_gain_or_loss = (
             round(self.sales_proceeds - self.cost_basis) if self.sales_proceeds and self.cost_basis else None
         )
-        self.lot_description = (
-            f"{round(self.tx_in.currency_out_volume, 2)} {cryptocurrency.upper()} - CRYPTO"
-            if self.tx_in
-            else f"{round(self.tx_out.currency_out_volume, 2)} {cryptocurrency.upper()} - CRYPTO"
+
+    @property
+    def date_acquired_str(self) -> Union[str, None]:
+        return self.date_acquired.strftime("%m/%d/%Y") if self.tx_in else None
+
+    @property
+    def date_sold_str(self) -> Union[str, None]:
+        return self.date_sold.strftime("%m/%d/%Y") if self.tx_out else None
+
+    @property
+    def short_term(self) -> Union[bool, None]:
+        return (
+            relativedelta(self.date_sold, self.date_acquired).years == 0
+            if self.date_sold and self.date_acquired
+            else None
         )
 
+    @property
+    def long_term(self) -> Union[bool, None]:
+        short_term = self.short_term
+        return not short_term if short_term else None
+
+    @property
+    def lot_volume(self) -> float:
+        return self.tx_in.currency_out_volume if self.tx_in else self.tx_out.currency_out_volume
+
+    @property
+    def lot_description(self) -> str:
+        return f"{round(self.lot_volume, 2)} {self.cryptocurrency.upper()} - CRYPTO"
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in TaxableTransaction.FIELDS}
+
     def __repr__(self):
-        return f"{self.__class__.__name__}({', '.join([f'{k}={v}' for k, v in self.__dict__.items()])})"
+        return f"{self.__class__.__name__}({', '.join([f'{k}={v}' for k, v in self.to_dict().items()])})"
 
     def __str__(self):
         return (
             f"{self.__class__.__name__}: {{{NEWLINE}  "
-            f"{f',{NEWLINE}  '.join([f'{k}: {v}' for k, v in self.__dict__.items()])}"
+            f"{f',{NEWLINE}  '.join([f'{k}: {v}' for k, v in self.to_dict().items()])}"
             f"{NEWLINE}}}"
         )
 
     def to_pd_series(self):
         exclude_fields = ["tx_in", "tx_out"]
-        series_data = {k: v for k, v in self.__dict__.items() if k not in exclude_fields}
+        series_data = {k: v for k, v in self.to_dict().items() if k not in exclude_fields}
         return Series(data=series_data)
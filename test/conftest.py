@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the repo modules are imported from the repo root, e.g. data.dao.sheets, however pytest is started
+sys.path.insert(0, str(Path(__file__).parent.parent))
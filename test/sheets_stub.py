@@ -0,0 +1,54 @@
+from threading import Lock, current_thread
+from typing import Dict, List
+
+from pandas import DataFrame
+
+
+def get_sheet_values(raw_df: DataFrame) -> List[list]:
+    # the rows of a ledger frame as the Sheets API returns them, header row first
+    return [raw_df.columns.tolist()] + raw_df.values.tolist()
+
+
+class StubRequest(object):
+
+    def __init__(self, result: dict):
+        self._result = result
+
+    def execute(self) -> dict:
+        return self._result
+
+
+class StubSheetsService(object):
+
+    def __init__(self, values_by_range: Dict[str, Dict[str, List[list]]]):
+        # {sheet id: {range: values}}
+        self.values_by_range = values_by_range
+        self.batch_get_calls = []
+        self._lock = Lock()
+
+    def spreadsheets(self) -> "StubSheetsService":
+        return self
+
+    def values(self) -> "StubSheetsService":
+        return self
+
+    def batchGet(self, spreadsheetId: str, ranges: List[str], **kwargs) -> StubRequest:
+        with self._lock:
+            self.batch_get_calls.append((spreadsheetId, list(ranges), current_thread().name))
+        return StubRequest({"valueRanges": [
+            {"range": sheet_range, "values": self.values_by_range[spreadsheetId][sheet_range]}
+            for sheet_range in ranges
+        ]})
+
+
+class StubDriveService(object):
+
+    def __init__(self, revisions: Dict[str, str]):
+        # {sheet id: modified time}
+        self.revisions = revisions
+
+    def files(self) -> "StubDriveService":
+        return self
+
+    def get(self, fileId: str, fields: str) -> StubRequest:
+        return StubRequest({"modifiedTime": self.revisions[fileId]})
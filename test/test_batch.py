@@ -0,0 +1,48 @@
+import json
+
+from api.batch import load_manifest, run_batch
+from benchmark.ledger import generate_ledger
+
+
+def write_manifest(tmp_path, manifest: list):
+    generate_ledger(200).to_csv(tmp_path / "ledger.csv", index=False)
+    with open(tmp_path / "manifest.json", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    return tmp_path / "manifest.json"
+
+
+def test_list_of_ranges_is_joined(tmp_path):
+    manifest_path = write_manifest(tmp_path, [
+        {"name": "sheets", "source": "sheets", "sheet_id": "sheet", "ranges": ["Coinbase!A:Y", "other:Kraken!A:Y"]}
+    ])
+
+    portfolio = load_manifest(manifest_path)[0]
+    assert portfolio["ranges"] == "Coinbase!A:Y;other:Kraken!A:Y"
+    assert "error" not in portfolio
+
+
+def test_broken_entries_only_fail_their_portfolio(tmp_path):
+    manifest_path = write_manifest(tmp_path, [
+        {"name": "good", "path": "ledger.csv", "tax_year": 2018},
+        {"name": "ranges", "source": "sheets", "sheet_id": "sheet", "ranges": [["A!A:Y"]]},
+        {"name": "good", "path": "ledger.csv"},
+        {"name": "cost_basis", "path": "ledger.csv", "cost_basis": "average"},
+        "not a portfolio",
+        {"name": "missing", "path": "missing.csv"},
+        {"name": "also_good", "path": "ledger.csv", "cost_basis": "lifo"}
+    ])
+
+    summary = run_batch(load_manifest(manifest_path), tmp_path / "output", jobs=2)
+
+    assert [(result["name"], result["status"]) for result in summary["results"]] == [
+        ("good", "ok"),
+        ("ranges", "failed"),
+        ("good", "failed"),
+        ("cost_basis", "failed"),
+        ("portfolio-5", "failed"),
+        ("missing", "failed"),
+        ("also_good", "ok")
+    ]
+    assert "must be a string" in summary["results"][1]["error"]
+    assert "Duplicate portfolio name" in summary["results"][2]["error"]
+    assert summary["results"][0]["capital_gains_and_losses"] > 0
@@ -0,0 +1,66 @@
+import json
+
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+from data.dao import client
+from data.dao.client import SCOPES, GoogleClientProvider
+
+OLD_SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+
+
+class StubFlow(object):
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+
+    def run_local_server(self, port: int) -> Credentials:
+        return Credentials(token="new", refresh_token="refresh", client_id="id", client_secret="secret",
+                           token_uri="https://oauth2.googleapis.com/token", scopes=self.scopes)
+
+
+def write_token(auth_dir):
+    auth_dir.mkdir()
+    with open(auth_dir / "token.json", "w") as token:
+        json.dump({
+            "token": "old",
+            "refresh_token": "refresh",
+            "client_id": "id",
+            "client_secret": "secret",
+            "scopes": OLD_SCOPES,
+            "expiry": "2020-01-01T00:00:00Z"
+        }, token)
+
+
+def test_token_is_refreshed_with_its_granted_scopes(tmp_path, monkeypatch):
+    write_token(tmp_path / "auth")
+    refreshed_scopes = []
+
+    def refresh(creds, request):
+        refreshed_scopes.append(creds.scopes)
+        creds.token = "refreshed"
+        creds.expiry = None
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    creds = GoogleClientProvider(auth_dir=tmp_path / "auth").get_credentials()
+
+    assert refreshed_scopes == [OLD_SCOPES]
+    assert creds.token == "refreshed"
+
+
+def test_rejected_refresh_logs_in_again(tmp_path, monkeypatch):
+    write_token(tmp_path / "auth")
+
+    def refresh(creds, request):
+        raise RefreshError("invalid_scope")
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    monkeypatch.setattr(
+        client.InstalledAppFlow, "from_client_secrets_file", lambda file_path, scopes: StubFlow(scopes)
+    )
+    creds = GoogleClientProvider(auth_dir=tmp_path / "auth").get_credentials()
+
+    assert creds.token == "new"
+    assert creds.scopes == SCOPES
+    with open(tmp_path / "auth" / "token.json") as token:
+        assert json.load(token)["scopes"] == SCOPES
@@ -0,0 +1,26 @@
+import pytest
+from pandas import concat
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+
+
+def get_taxable_crypto(raw_df, tax_year: int, **kwargs) -> TaxableCrypto:
+    tx_data = TxData("usd", table=MemoryTable("usd", raw_df))
+    return TaxableCrypto(tax_year=tax_year, fiat_currency="usd", tx_data=tx_data, **kwargs)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("tax_year", [None, 2018])
+def test_export_batches_are_the_printed_report(tax_year, workers):
+    raw_df = generate_ledger(5_000, ticker_count=6)
+
+    report_df = get_taxable_crypto(raw_df, tax_year).get_capital_gains_and_losses_df()
+    export_dfs = list(get_taxable_crypto(raw_df, tax_year, workers=workers).iter_capital_gains_and_losses_dfs(
+        batch_size=300
+    ))
+
+    assert len(export_dfs) > 1
+    assert concat(export_dfs).equals(report_df)
@@ -0,0 +1,52 @@
+import pytest
+
+from benchmark.ledger import generate_ledger
+from data.dao.csv import CsvTable
+from data.dao.memory import MemoryTable
+
+
+@pytest.fixture
+def raw_df():
+    raw_df = generate_ledger(20)
+    raw_df["Tx Cost"] = raw_df["Tx Cost"].astype(object)
+    raw_df["Daily Avg. (TO)"] = raw_df["Daily Avg. (TO)"].astype(object)
+    raw_df.loc[raw_df.index[2], "Tx Cost"] = "1,234.50"
+    raw_df.loc[raw_df.index[12], "Daily Avg. (TO)"] = "n/a"
+    return raw_df
+
+
+def test_csv_reports_invalid_cells_like_memory(tmp_path, raw_df):
+    raw_df.to_csv(tmp_path / "ledger.csv", index=False)
+
+    with pytest.raises(ValueError, match="2 invalid cells found") as memory_error:
+        MemoryTable("usd", raw_df)
+    with pytest.raises(ValueError, match="2 invalid cells found") as csv_error:
+        CsvTable("usd", tmp_path / "ledger.csv")
+
+    assert str(csv_error.value) == str(memory_error.value)
+
+
+def test_chunked_csv_numbers_rows_across_chunks(tmp_path, raw_df):
+    raw_df.loc[raw_df.index[2], "Tx Cost"] = "1.5"
+    raw_df.to_csv(tmp_path / "ledger.csv", index=False)
+
+    chunked_table = CsvTable("usd", tmp_path / "ledger.csv", chunk_size=5)
+    with pytest.raises(ValueError, match="1 invalid cells found"):
+        list(chunked_table.iter_partitions())
+
+    assert chunked_table.invalid_cells.to_dict("records") == [
+        {"row": 13, "column": "Daily Avg. (TO)", "value": "n/a"}
+    ]
+
+
+@pytest.mark.parametrize("value", ["1_000", "١٢٣"])
+def test_numbers_float_accepts_are_still_invalid(tmp_path, value):
+    raw_df = generate_ledger(20)
+    raw_df["Fee"] = raw_df["Fee"].astype(object)
+    raw_df.loc[raw_df.index[4], "Fee"] = value
+    raw_df.to_csv(tmp_path / "ledger.csv", index=False)
+
+    for table_class, source in [(MemoryTable, raw_df), (CsvTable, tmp_path / "ledger.csv")]:
+        with pytest.raises(ValueError, match="1 invalid cells found") as error:
+            table_class("usd", source)
+        assert value in str(error.value)
@@ -0,0 +1,68 @@
+import pytest
+from pandas import DataFrame, concat
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+from evaluate.kernel import KERNELS
+
+
+def get_capital_gains_and_losses_df(raw_df: DataFrame, kernel: str, tax_year: int = None) -> DataFrame:
+    tx_data = TxData("usd", table=MemoryTable("usd", raw_df))
+    return TaxableCrypto(
+        tax_year=tax_year, fiat_currency="usd", tx_data=tx_data, kernel=kernel
+    ).get_capital_gains_and_losses_df()
+
+
+@pytest.mark.parametrize("tax_year", [None, 2018])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_numpy_kernel_matches_object_kernel(tax_year, seed):
+    raw_df = generate_ledger(2_000, ticker_count=4, seed=seed)
+
+    object_df = get_capital_gains_and_losses_df(raw_df, "object", tax_year)
+    numpy_df = get_capital_gains_and_losses_df(raw_df, "numpy", tax_year)
+
+    assert len(object_df) > 0
+    assert numpy_df.equals(object_df)
+
+
+@pytest.mark.parametrize("tax_year", [None, 2018])
+def test_lots_and_sales_without_volume_are_not_matched(tax_year):
+    raw_df = generate_ledger(2_000, ticker_count=4)
+    # every 10th buy and sell is repeated right after itself without volume
+    zero_rows = raw_df[raw_df["Tx Type"].isin(["BUY", "SELL"])].iloc[::10].copy()
+    zero_rows["Tx Cost"] = 0.0
+    zero_rows["Fee"] = 0.0
+    zero_raw_df = concat([raw_df, zero_rows]).sort_index(kind="stable").reset_index(drop=True)
+
+    object_df = get_capital_gains_and_losses_df(zero_raw_df, "object", tax_year)
+    numpy_df = get_capital_gains_and_losses_df(zero_raw_df, "numpy", tax_year)
+
+    assert numpy_df.equals(object_df)
+    assert object_df.equals(get_capital_gains_and_losses_df(raw_df, "object", tax_year))
+
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_lot_without_volume_is_skipped(kernel):
+    raw_df = DataFrame([
+        ["BUY", "01/01/2019", 0.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+        ["BUY", "01/02/2019", 1000.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+        ["SELL", "01/05/2019", 0.0, 0.0, "BTC", 900.0, "USD", 1.0, "1"],
+        ["SELL", "01/06/2019", 450.0, 0.0, "BTC", 900.0, "USD", 1.0, "2"]
+    ], columns=generate_ledger(1).columns)
+
+    capital_gains_and_losses_df = get_capital_gains_and_losses_df(raw_df, kernel)
+
+    assert capital_gains_and_losses_df["capital_gain_or_loss"].tolist() == [-50]
+
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_sale_before_any_lot_is_rejected(kernel):
+    raw_df = DataFrame([
+        ["SELL", "01/05/2019", 500.0, 0.5, "BTC", 500.0, "USD", 1.0, "1"],
+        ["BUY", "01/10/2019", 1000.0, 1.0, "USD", 1.0, "BTC", 1000.0, "--"]
+    ], columns=generate_ledger(1).columns)
+
+    with pytest.raises(IndexError, match="Currency out transaction detected before currency in transaction"):
+        get_capital_gains_and_losses_df(raw_df, kernel)
@@ -0,0 +1,65 @@
+import pytest
+from pandas import concat
+
+from benchmark.ledger import generate_ledger
+from data.dao.cache import SheetsCache
+from data.dao.memory import MemoryTable
+from data.dao.sheets import SheetsTable
+from data.extract import parse_sheet_ranges
+from sheets_stub import StubDriveService, StubSheetsService, get_sheet_values
+
+
+@pytest.fixture
+def raw_dfs():
+    raw_df = generate_ledger(90)
+    # the second tab lists its columns in another order, they are aligned by the header row
+    return [raw_df.iloc[:30], raw_df.iloc[30:60], raw_df.iloc[60:][list(reversed(raw_df.columns))]]
+
+
+@pytest.fixture
+def services(raw_dfs):
+    sheets_service = StubSheetsService({
+        "first": {"Coinbase!A:Y": get_sheet_values(raw_dfs[0]), "Kraken!A:Y": get_sheet_values(raw_dfs[1])},
+        "second": {"Gemini!A:Y": get_sheet_values(raw_dfs[2])}
+    })
+    drive_service = StubDriveService({"first": "2021-01-01T00:00:00.000Z", "second": "2021-01-01T00:00:00.000Z"})
+    return sheets_service, drive_service
+
+
+def get_table(services, tmp_path, workers: int) -> SheetsTable:
+    sheets_service, drive_service = services
+    return SheetsTable(
+        "usd", "first", "transactions", "A", "Y", service=sheets_service, drive_service=drive_service,
+        cache=SheetsCache(tmp_path / "cache"), workers=workers,
+        sheet_ranges=parse_sheet_ranges("Coinbase!A:Y;Kraken!A:Y;second:Gemini!A:Y", "first")
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ranges_of_two_spreadsheets_are_merged(services, raw_dfs, tmp_path, workers):
+    table = get_table(services, tmp_path, workers)
+
+    expected_df = concat(raw_dfs, ignore_index=True)[list(raw_dfs[0].columns)]
+    assert table.data.equals(MemoryTable("usd", expected_df).data)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_one_batch_get_per_spreadsheet(services, tmp_path, workers):
+    sheets_service, _ = services
+    get_table(services, tmp_path, workers)
+
+    assert sorted((sheet_id, ranges) for sheet_id, ranges, _ in sheets_service.batch_get_calls) == [
+        ("first", ["Coinbase!A:Y", "Kraken!A:Y"]),
+        ("second", ["Gemini!A:Y"])
+    ]
+    thread_names = {thread_name for _, _, thread_name in sheets_service.batch_get_calls}
+    assert ("MainThread" in thread_names) == (workers == 1)
+
+
+def test_sheet_ranges_without_sheet_id():
+    assert parse_sheet_ranges("A:Y;A1:Y500;Coinbase!A:Y;second:Kraken!A:Y", "first") == [
+        ("first", "A:Y"),
+        ("first", "A1:Y500"),
+        ("first", "Coinbase!A:Y"),
+        ("second", "Kraken!A:Y")
+    ]
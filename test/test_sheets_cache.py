@@ -0,0 +1,63 @@
+import pytest
+
+from benchmark.ledger import generate_ledger
+from data.dao.cache import SheetsCache
+from data.dao.sheets import SheetsTable
+from sheets_stub import StubDriveService, StubSheetsService, get_sheet_values
+
+SHEET_ID = "sheet"
+SHEET_RANGE = "Ledger!A:Y"
+
+
+def get_table(sheets_service: StubSheetsService = None, drive_service: StubDriveService = None,
+              cache: SheetsCache = None, offline: bool = False) -> SheetsTable:
+    return SheetsTable(
+        "usd", SHEET_ID, "Ledger", "A", "Y", offline=offline, service=sheets_service, drive_service=drive_service,
+        cache=cache
+    )
+
+
+@pytest.fixture
+def cache(tmp_path) -> SheetsCache:
+    return SheetsCache(tmp_path / "cache")
+
+
+def test_unchanged_revision_is_loaded_from_cache(cache):
+    sheets_service = StubSheetsService({SHEET_ID: {SHEET_RANGE: get_sheet_values(generate_ledger(50))}})
+    drive_service = StubDriveService({SHEET_ID: "2021-01-01T00:00:00.000Z"})
+
+    fetched_table = get_table(sheets_service, drive_service, cache)
+    cached_table = get_table(sheets_service, drive_service, cache)
+
+    assert len(sheets_service.batch_get_calls) == 1
+    assert len(fetched_table.data) == 50
+    assert cached_table.data.equals(fetched_table.data)
+
+
+def test_changed_revision_is_fetched_again(cache):
+    sheets_service = StubSheetsService({SHEET_ID: {SHEET_RANGE: get_sheet_values(generate_ledger(50))}})
+    drive_service = StubDriveService({SHEET_ID: "2021-01-01T00:00:00.000Z"})
+    get_table(sheets_service, drive_service, cache)
+
+    sheets_service.values_by_range[SHEET_ID][SHEET_RANGE] = get_sheet_values(generate_ledger(60))
+    drive_service.revisions[SHEET_ID] = "2021-01-02T00:00:00.000Z"
+    changed_table = get_table(sheets_service, drive_service, cache)
+
+    assert len(sheets_service.batch_get_calls) == 2
+    assert len(changed_table.data) == 60
+    assert get_table(sheets_service, drive_service, cache).data.equals(changed_table.data)
+    assert len(sheets_service.batch_get_calls) == 2
+
+
+def test_offline_reads_only_the_cache(cache):
+    with pytest.raises(FileNotFoundError):
+        get_table(cache=cache, offline=True)
+
+    sheets_service = StubSheetsService({SHEET_ID: {SHEET_RANGE: get_sheet_values(generate_ledger(50))}})
+    drive_service = StubDriveService({SHEET_ID: "2021-01-01T00:00:00.000Z"})
+    fetched_table = get_table(sheets_service, drive_service, cache)
+
+    # no services are passed, so any network access would have to build real clients
+    offline_table = get_table(cache=cache, offline=True)
+    assert offline_table.data.equals(fetched_table.data)
+    assert offline_table.get_source_version() is None
@@ -0,0 +1,38 @@
+import pytest
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.state import load_open_lots, save_open_lots
+
+SOURCE_ID = "/ledgers/portfolio.csv"
+
+
+@pytest.fixture
+def open_lots():
+    tx_data = TxData("usd", table=MemoryTable("usd", generate_ledger(20, ticker_count=2)))
+    return {"btc": tx_data.retrieve_buy_events(None, "usd", "timestamp", "ascending")[:3]}
+
+
+def test_open_lots_are_loaded_as_saved(tmp_path, open_lots):
+    save_open_lots(open_lots, "usd", 2018, "fifo", SOURCE_ID, state_dir=tmp_path)
+
+    loaded_open_lots = load_open_lots("usd", 2018, "fifo", SOURCE_ID, state_dir=tmp_path)
+    assert [tx.timestamp for tx in loaded_open_lots["btc"]] == [tx.timestamp for tx in open_lots["btc"]]
+
+
+def test_other_cost_basis_method_is_rejected(tmp_path, open_lots):
+    save_open_lots(open_lots, "usd", 2018, "fifo", SOURCE_ID, state_dir=tmp_path)
+
+    with pytest.raises(ValueError, match="fifo"):
+        load_open_lots("usd", 2018, "hifo", SOURCE_ID, state_dir=tmp_path)
+
+
+def test_ledgers_keep_their_own_open_lots(tmp_path, open_lots):
+    save_open_lots(open_lots, "usd", 2018, "fifo", SOURCE_ID, state_dir=tmp_path)
+    save_open_lots({}, "usd", 2018, "fifo", "/ledgers/other.csv", state_dir=tmp_path)
+
+    assert len(load_open_lots("usd", 2018, "fifo", SOURCE_ID, state_dir=tmp_path)["btc"]) == 3
+    assert load_open_lots("usd", 2018, "fifo", "/ledgers/other.csv", state_dir=tmp_path) == {}
+    with pytest.raises(FileNotFoundError):
+        load_open_lots("usd", 2018, "fifo", "/ledgers/missing.csv", state_dir=tmp_path)
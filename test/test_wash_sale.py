@@ -0,0 +1,73 @@
+import pytest
+from pandas import DataFrame, concat
+
+from benchmark.ledger import generate_ledger
+from data.dao.memory import MemoryTable
+from data.extract import TxData
+from evaluate.capital import TaxableCrypto
+
+PATHS = [{}, {"kernel": "numpy"}, {"chunk_size": 2}, {"workers": 2}]
+
+# a loss on 12/20/2019 is washed by the repurchase on 01/05/2020, in the next tax year
+YEAR_END_ROWS = [
+    ["BUY", "01/10/2019", 1000.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+    ["SELL", "12/20/2019", 500.0, 0.0, "BTC", 500.0, "USD", 1.0, "1"],
+    ["BUY", "01/05/2020", 400.0, 0.0, "USD", 1.0, "BTC", 400.0, "--"]
+]
+
+
+def get_taxable_crypto(rows: list, **kwargs) -> TaxableCrypto:
+    raw_df = DataFrame(rows, columns=generate_ledger(1).columns)
+    tx_data = TxData("usd", table=MemoryTable("usd", raw_df))
+    return TaxableCrypto(tax_year=2019, fiat_currency="usd", tx_data=tx_data, wash_sales=True, **kwargs)
+
+
+def get_wash_sales(rows: list, **kwargs) -> list:
+    capital_gains_and_losses_df = get_taxable_crypto(rows, **kwargs).get_capital_gains_and_losses_df()
+    return list(zip(
+        capital_gains_and_losses_df["capital_gain_or_loss"],
+        capital_gains_and_losses_df["wash_sale"],
+        capital_gains_and_losses_df["disallowed_loss"]
+    ))
+
+
+@pytest.mark.parametrize("kwargs", PATHS)
+def test_repurchase_after_tax_year_end_is_a_wash_sale(kwargs):
+    assert get_wash_sales(YEAR_END_ROWS, **kwargs) == [(-500, True, 500)]
+
+
+@pytest.mark.parametrize("kwargs", PATHS)
+def test_lots_sold_by_the_same_sale_are_no_replacement(kwargs):
+    rows = [
+        ["BUY", "01/01/2019", 1000.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+        ["BUY", "01/02/2019", 1000.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+        ["SELL", "01/10/2019", 1600.0, 0.0, "BTC", 800.0, "USD", 1.0, "1"]
+    ]
+    assert get_wash_sales(rows, **kwargs) == [(-200, False, 0), (-200, False, 0)]
+
+
+@pytest.mark.parametrize("kwargs", PATHS)
+def test_rest_of_a_lot_sold_in_parts_is_no_replacement(kwargs):
+    rows = [
+        ["BUY", "01/01/2019", 1000.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+        ["SELL", "01/10/2019", 400.0, 0.0, "BTC", 800.0, "USD", 1.0, "1"],
+        ["SELL", "01/11/2019", 400.0, 0.0, "BTC", 800.0, "USD", 1.0, "2"]
+    ]
+    assert get_wash_sales(rows, **kwargs) == [(-100, False, 0), (-100, False, 0)]
+
+
+@pytest.mark.parametrize("kwargs", PATHS)
+def test_partial_repurchase_disallows_part_of_the_loss(kwargs):
+    rows = [
+        ["BUY", "01/01/2019", 1000.0, 0.0, "USD", 1.0, "BTC", 1000.0, "--"],
+        ["SELL", "06/01/2019", 800.0, 0.0, "BTC", 800.0, "USD", 1.0, "1"],
+        ["BUY", "06/10/2019", 320.0, 0.0, "USD", 1.0, "BTC", 800.0, "--"]
+    ]
+    assert get_wash_sales(rows, **kwargs) == [(-200, True, 80)]
+
+
+def test_export_agrees_with_report():
+    report_df = get_taxable_crypto(YEAR_END_ROWS).get_capital_gains_and_losses_df()
+    export_df = concat(list(get_taxable_crypto(YEAR_END_ROWS).iter_capital_gains_and_losses_dfs()))
+
+    assert export_df.equals(report_df)
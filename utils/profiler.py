@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, List, Union
+
+
+class StageStats(object):
+    __slots__ = ("calls", "rows", "seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+
+class Stage(object):
+    __slots__ = ("profiler", "name", "rows", "start", "child_seconds")
+
+    def __init__(self, profiler: "Profiler", name: str, rows: int = 0):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+        self.start = 0.0
+        self.child_seconds = 0.0
+
+    def add_rows(self, rows: int):
+        self.rows += rows
+
+    def __enter__(self):
+        self.profiler._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        seconds = time.perf_counter() - self.start
+        self.profiler._stack.pop()
+        # nested stages are only counted once, by the innermost stage
+        if self.profiler._stack:
+            self.profiler._stack[-1].child_seconds += seconds
+
+        stats = self.profiler.stages.setdefault(self.name, StageStats())
+        stats.calls += 1
+        stats.rows += self.rows
+        stats.seconds += seconds - self.child_seconds
+        return False
+
+
+class NullStage(object):
+    __slots__ = ()
+
+    def add_rows(self, rows: int):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Profiler(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = OrderedDict()  # type: Dict[str, StageStats]
+        self._stack = []  # type: List[Stage]
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.stages = OrderedDict()
+        self._stack = []
+
+    def stage(self, name: str, rows: int = 0) -> Union[Stage, NullStage]:
+        return Stage(self, name, rows) if self.enabled else NULL_STAGE
+
+    def get_stages(self) -> List[dict]:
+        return [
+            {"stage": name, "calls": stats.calls, "rows": stats.rows, "seconds": round(stats.seconds, 4)}
+            for name, stats in self.stages.items()
+        ]
+
+    def report(self) -> str:
+        lines = [f"{'stage':<16}{'calls':>8}{'rows':>12}{'seconds':>12}{'rows/s':>14}"]
+        for name, stats in self.stages.items():
+            rows_per_second = f"{stats.rows / stats.seconds:,.0f}" if stats.rows and stats.seconds else "-"
+            lines.append(
+                f"{name:<16}{stats.calls:>8}{stats.rows or '-':>12}{stats.seconds:>12.4f}{rows_per_second:>14}"
+            )
+        lines.append(f"{'total':<16}{'':>8}{'':>12}{sum(s.seconds for s in self.stages.values()):>12.4f}")
+        return "\n".join(lines)
+
+
+PROFILER = Profiler()
+
+
+def stage(name: str, rows: int = 0) -> Union[Stage, NullStage]:
+    return PROFILER.stage(name, rows)
+
+
+def profile_stage(name: str, rows: Callable[..., int] = None):
+
+    # rows is called with the arguments of the decorated function to count the rows it processes
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.stage(name, rows(*args, **kwargs) if rows else 0):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator